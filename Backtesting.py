@@ -1,11 +1,12 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from MarketData import CandleFrame
+from Metrics import metrics
 from Utils import check_save_location
-from fpdf import FPDF
 
 
-def backtest(strategy, df, capital=1000, symbol=''):
+def backtest(strategy, df, capital=1000, symbol='', vectorized=True, report=False, verbose=1):
     """
     Backtest your strategy with this function
 
@@ -15,8 +16,8 @@ def backtest(strategy, df, capital=1000, symbol=''):
     strategy : Strategy object
         Object that has StrategyBase as parent class
 
-    df : pandas dataframe
-        dataframe containing the trading data
+    df : pandas dataframe or CandleFrame
+        dataframe containing the trading data, a CandleFrame only computes the indicators the strategy uses
 
     capital : float
         capital we can use
@@ -24,12 +25,190 @@ def backtest(strategy, df, capital=1000, symbol=''):
     symbol : str
         symbol of the currency
 
+    vectorized : boolean
+        use the vectorized engine when the strategy implements buy_signals/sell_signals, otherwise the strategy is
+        evaluated row by row
+
+    report : boolean
+        directly render the plots and pdf, otherwise they can be rendered later with BacktestResult.render or in
+        batch with render_reports
+
+    verbose : int
+        print the summary
+
+    Returns
+    -------
+    BacktestResult
+        the actual trades with the buying/selling dates, profits, returns and open prices and the performance measures
+    """
+
+    with metrics.timer("backtest_trades"):
+        actual_trades, capital_list = backtest_trades(strategy, df, capital=capital, vectorized=vectorized)
+    with metrics.timer("backtest_performance"):
+        measures = performance(df, actual_trades, capital, capital_list)
+    metrics.set("backtest_rows", len(df))
+    result = BacktestResult(strategy.__module__, symbol, df, actual_trades, capital, measures)
+    if verbose:
+        print(result.summary())
+    if report:
+        result.render()
+    return result
+
+
+class BacktestResult(object):
+    """
+    Results of a backtest. Only the summary is available right away, the plots and pdf are rendered on request so
+    matplotlib and fpdf are never imported when they are not needed.
+    """
+
+    def __init__(self, strategy_name, symbol, df, actual_trades, capital, measures):
+        self.strategy_name = strategy_name
+        self.symbol = symbol
+        self.df = df
+        self.actual_trades = actual_trades
+        self.capital = capital
+        self.measures = measures
+
+    @property
+    def texts(self):
+        measures = self.measures
+        if measures["trades"] == 0:
+            return ["NO TRADES HAVE TAKEN PLACE"]
+        return [f"average returns: {measures['average returns']:.6f}\n",
+                f"returns: {measures['returns']:.6f}",
+                f"winning rate:  {measures['winning rate']:.2f}",
+                f"starting capital: {self.capital:.2f}",
+                f"end capital: {measures['end capital']:.2f}",
+                f"return: {measures['return']:.6f}"]
+
+    def summary(self):
+        return '\n'.join(self.texts)
+
+    def save_paths(self):
+        """
+        Paths of the plot and the pdf
+        """
+        time_slots = self.df.index.strftime('%d-%m-%Y')
+        directory = f'results_backtesting/{self.strategy_name}/{self.symbol}'
+        period = f'{time_slots[0]}_to_{time_slots[-1]}'
+        return f'{directory}/plots/{period}.png', f'{directory}/pdfs/{period}.pdf'
+
+    def render(self, pdf=True):
+        """
+        Render the plot and, if pdf, the pdf with the results
+
+        Returns
+        -------
+        (str, str)
+            paths of the plot and the pdf
+        """
+        save_path_plots, save_path_pdf = self.save_paths()
+        with metrics.timer("render", output="plot"):
+            plot_results(df=self.df, actual_trades=self.actual_trades, save_path=save_path_plots)
+        if pdf:
+            with metrics.timer("render", output="pdf"):
+                make_pdf(actual_trades=self.actual_trades, texts=self.texts, symbol=self.symbol,
+                         save_path_pdf=save_path_pdf, save_path_plots=save_path_plots)
+        return save_path_plots, save_path_pdf
+
+
+def _init_report_worker():
+    import matplotlib
+    matplotlib.use("Agg")  # the workers only save figures
+
+
+def _render(result):
+    return result.render()
+
+
+def render_reports(results, processes=None, wait=True):
+    """
+    Render the plots and pdfs of many backtests in a pool of worker processes
+
+    Parameters
+    ----------
+
+    results : list of BacktestResult
+        results to render
+
+    processes : int
+        number of worker processes, all cores if None
+
+    wait : boolean
+        wait until all reports are rendered, otherwise return immediately with the futures
+
+    Returns
+    -------
+    list
+        the (plot, pdf) paths per result, or the futures of them if not wait
+    """
+    executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_report_worker)
+    futures = [executor.submit(_render, result) for result in results]
+    executor.shutdown(wait=wait)
+    return [future.result() for future in futures] if wait else futures
+
+
+def backtest_trades(strategy, df, capital=1000, vectorized=True):
+    """
+    Trades of the strategy without any reporting, with the vectorized engine if the strategy supports it
+
+    Returns
+    -------
+    (Pandas dataframe, list)
+        the actual trades and the capital after every sell
+    """
+    with metrics.timer("backtest_signals"):
+        signals = signal_arrays(strategy, df) if vectorized else None
+    if signals is not None:
+        return backtest_signals(df, *signals, stop_loss=strategy.stop_loss, capital=capital)
+    return backtest_rows(strategy, df, capital=capital)
+
+
+def performance(df, actual_trades, capital, capital_list):
+    """
+    Performance measures of the actual trades, the return of every trade is added to actual_trades
+
     Returns
     -------
-    Pandas dataframe
-        dataframe containing the buying/selling dates with the profits, returns and open prices
+    dict
+        the number of trades, average returns, compounded returns, winning rate, end capital and return on the
+        capital
     """
 
+    if len(actual_trades) == 0:
+        return {"trades": 0, "average returns": np.nan, "returns": 0.0, "winning rate": np.nan,
+                "end capital": capital, "return": 0.0}
+
+    # performance measures, the trades are executed at the open prices of their dates
+    buying_prices = actual_trades.buying_open_price.to_numpy()
+    selling_prices = actual_trades.selling_open_price.to_numpy()
+    wins = (selling_prices - buying_prices) > 0
+    winning_rate = np.sum([wins]) / len(wins)
+    returns = (selling_prices - buying_prices) / buying_prices
+
+    # adding performance measures to dataframe
+    actual_trades["return"] = returns
+    return {"trades": len(returns),
+            "average returns": sum(returns) / max(1, len(returns)),
+            "returns": np.prod(returns + 1) - 1,
+            "winning rate": winning_rate,
+            "end capital": capital_list[-1],
+            "return": (capital_list[-1] - capital) / capital}
+
+
+def backtest_rows(strategy, df, capital=1000):
+    """
+    Reference backtest engine which calls strategy.action on the history up to every row
+
+    Returns
+    -------
+    (Pandas dataframe, list)
+        the actual trades and the capital after every sell
+    """
+
+    if isinstance(df, CandleFrame):
+        df = df.to_frame()
+
     buying_dates = []
     buying_open_prices = []
     selling_dates = []
@@ -68,42 +247,117 @@ def backtest(strategy, df, capital=1000, symbol=''):
     actual_trades = pd.DataFrame(
         {"buying_date": buying_dates, "selling_date": selling_dates, "buying_open_price": buying_open_prices,
          "selling_open_price": selling_open_prices})
+    return actual_trades, capital_list
 
-    # plot results
-    time_slots = df.index.strftime('%d-%m-%Y')
-    save_path_plots = f'results_backtesting/{strategy.__module__}/{symbol}/plots/{time_slots[0]}_to_{time_slots[-1]}.png'
-    plot_results(df=df, actual_trades=actual_trades, save_path=save_path_plots)
-
-    # if there are actual trades retrieve the performance measures
-    if len(actual_trades) > 0:
-        # performance measures
-        wins = (df.loc[actual_trades.selling_date].Open.values - df.loc[actual_trades.buying_date].Open.values) > 0
-        winning_rate = np.sum([wins]) / len(wins)
-        returns = (df.loc[actual_trades.selling_date].Open.values - df.loc[actual_trades.buying_date].Open.values) / \
-                  df.loc[actual_trades.buying_date].Open.values
-
-        # adding performance measures to dataframe
-        actual_trades["return"] = returns
-        texts = [f"average returns: {(sum(returns) / max(1, len(returns))):.6f}\n",
-                 f"returns: {(np.prod(returns + 1) - 1):.6f}",
-                 f"winning rate:  {winning_rate:.2f}",
-                 f"starting capital: {capital:.2f}",
-                 f"end capital: {capital_list[-1]:.2f}",
-                 f"return: {(capital_list[-1] - capital) / capital:.6f}"]
-        print('\n'.join(texts))
-    else:
-        texts = ["NO TRADES HAVE TAKEN PLACE"]
-        print("NO TRADES HAVE TAKEN PLACE")
-
-    # make pdf
-    save_path_pdf = f'results_backtesting/{strategy.__module__}/{symbol}/pdfs/{time_slots[0]}_to_{time_slots[-1]}.pdf'
-    make_pdf(actual_trades=actual_trades, texts=texts, symbol=symbol, save_path_pdf=save_path_pdf, save_path_plots=save_path_plots)
-
-    return actual_trades
+
+def signal_arrays(strategy, df):
+    """
+    Ask the strategy for its buy and sell signals over the whole dataframe
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray) or None
+        boolean buy and sell arrays, None if the strategy does not implement vectorized signals
+    """
+    try:
+        buy = np.asarray(strategy.buy_signals(df), dtype=bool)
+        sell = np.asarray(strategy.sell_signals(df), dtype=bool)
+    except NotImplementedError:
+        return None
+    return buy, sell
+
+
+def simulate_trades(buy, sell, close, open_prices, stop_loss=0.95, can_buy=True):
+    """
+    Walk the entry/exit/stop-loss state machine over precomputed signals. This follows Strategy.action: a signal on
+    row i is executed at the open of row i + 1, a sell signal has priority over the stop-loss and the signals on the
+    last row are never executed. Instead of visiting every row, the walk jumps from one signal to the next.
+
+    Parameters
+    ----------
+
+    buy : np.ndarray
+        boolean buy signal per row
+
+    sell : np.ndarray
+        boolean sell signal per row
+
+    close : np.ndarray
+        close prices, used for the stop-loss
+
+    open_prices : np.ndarray
+        open prices at which the trades are executed
+
+    stop_loss : float
+        sell if close / buying price < stop_loss
+
+    can_buy : boolean
+        whether we have capital to enter a position at all
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        row numbers of the buys and of the sells, an unsold last buy is included in the buys
+    """
+    last = len(close) - 1
+    buy_rows = np.flatnonzero(buy[:last]) if can_buy else np.empty(0, dtype=np.int64)
+    sell_rows = np.flatnonzero(sell[:last])
+    buys = []
+    sells = []
+    i = 0
+    while True:
+        # closed position: go to the next buy signal
+        k = np.searchsorted(buy_rows, i)
+        if k == len(buy_rows):
+            break
+        entry = buy_rows[k] + 1
+        buys.append(entry)
+        buying_price = open_prices[entry]
+
+        # open position: exit on the first sell signal or on an earlier stop-loss
+        k = np.searchsorted(sell_rows, entry)
+        exit_signal = sell_rows[k] if k < len(sell_rows) else None
+        window_end = exit_signal if exit_signal is not None else last
+        stops = np.flatnonzero(close[entry:window_end] / buying_price < stop_loss)
+        if len(stops) > 0:
+            exit_signal = entry + stops[0]
+        if exit_signal is None:
+            break
+        sells.append(exit_signal + 1)
+        i = exit_signal + 1
+
+    return np.asarray(buys, dtype=np.int64), np.asarray(sells, dtype=np.int64)
+
+
+def backtest_signals(df, buy, sell, stop_loss=0.95, capital=1000):
+    """
+    Vectorized backtest engine, gives the same trades as backtest_rows for strategies whose buy_signals and
+    sell_signals agree with buy_signal and sell_signal
+
+    Returns
+    -------
+    (Pandas dataframe, list)
+        the actual trades and the capital after every sell
+    """
+    open_prices = df.Open.to_numpy()
+    buys, sells = simulate_trades(buy, sell, df.Close.to_numpy(), open_prices, stop_loss=stop_loss,
+                                  can_buy=capital > 0)
+    buys = buys[:len(sells)]  # the last buy has not been sold yet
+
+    capital_list = [capital]
+    for buy_price, sell_price in zip(open_prices[buys], open_prices[sells]):
+        capital_list.append(capital_list[-1] / buy_price * sell_price)
+
+    actual_trades = pd.DataFrame(
+        {"buying_date": df.index[buys].tolist(), "selling_date": df.index[sells].tolist(),
+         "buying_open_price": open_prices[buys].tolist(), "selling_open_price": open_prices[sells].tolist()})
+    return actual_trades, capital_list
 
 
 def make_pdf(actual_trades: pd.DataFrame = None, texts: str = None, symbol: str = "", save_path_pdf: str = None,
              save_path_plots: str = None):
+    from fpdf import FPDF
+
     pdf = FPDF(orientation='L')
     pdf.set_font("Arial", style='B', size=20)
     pdf.add_page()
@@ -131,6 +385,11 @@ def make_pdf(actual_trades: pd.DataFrame = None, texts: str = None, symbol: str
 
 
 def plot_results(df: pd.DataFrame, actual_trades: pd.DataFrame, save_path: str = None):
+    import matplotlib.pyplot as plt
+
+    if isinstance(df, CandleFrame):  # only the plotted columns
+        df = df.to_frame(["Close", "SMA60", "EMA60", "RSI", "pct change", "CUM_RETURNS_60"])
+
     # plot results
     plt.style.use("ggplot")
     fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(12, 12))
@@ -165,3 +424,4 @@ def plot_results(df: pd.DataFrame, actual_trades: pd.DataFrame, save_path: str =
     plt.gcf().autofmt_xdate()
     check_save_location(save_path)
     plt.savefig(save_path)
+    plt.close(fig)
@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from Backtesting import backtest, make_pdf, plot_results
+from CoinbaseAPI import CoinbaseAPI
+from Indicators import IndicatorEngine
+from MarketData import CandleFrame
+from Strategy_RSI_SMA_RETURN import Strategy_RSI_SMA_RETURN
+
+BASELINE_PATH = "results_benchmarks/baselines.json"
+
+
+def synthetic_candles(n, seed=0, start=1_640_995_200, price=40000.0, volatility=0.001):
+    """
+    Reproducible random walk minute candles
+
+    Returns
+    -------
+    np.ndarray
+        (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+    """
+    rng = np.random.default_rng(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0, volatility, n)))
+    open_ = np.concatenate([[price], close[:-1]])
+    spread = np.abs(rng.normal(0, volatility / 2, n))
+    low = np.minimum(open_, close) * (1 - spread)
+    high = np.maximum(open_, close) * (1 + spread)
+    volume = rng.gamma(2.0, 0.5, n)
+    return np.column_stack([start + 60.0 * np.arange(n), low, high, open_, close, volume])
+
+
+def indicator_frame(candles):
+    """
+    DataFrame with the candles and their indicators, computed like the bot does
+    """
+    api = CoinbaseAPI(client=None, symbol="BENCH")
+    api.append_candles(candles)
+    return api.df
+
+
+class Benchmark(object):
+    """
+    A hot path that is timed on synthetic data. setup prepares the inputs outside the timing and returns the
+    function that is timed; max_bars caps the bars of benchmarks that are too slow for the largest sizes.
+    """
+
+    def __init__(self, name, setup, max_bars=None, requires=()):
+        self.name = name
+        self.setup = setup
+        self.max_bars = max_bars
+        self.requires = requires
+
+    def available(self):
+        for module in self.requires:
+            try:
+                __import__(module)
+            except ImportError:
+                return False
+        return True
+
+
+def _indicators_batch(candles, df, directory):
+    return lambda: indicator_frame(candles)
+
+
+def _indicators_streaming(candles, df, directory):
+    def run():
+        engine = IndicatorEngine()
+        for close in candles[:, 4]:
+            engine.update(close)
+    return run
+
+
+def _strategy_action(candles, df, directory, window=200):
+    strategy = Strategy_RSI_SMA_RETURN()
+    df = df.assign(last_buying_price=-1.0)
+
+    def run():
+        for end in range(window, len(df) + 1):  # the window of the live bot at every minute
+            strategy.action(df.iloc[end - window:end], entried=False)
+    return run
+
+
+def _backtest(candles, df, directory):
+    return lambda: backtest(Strategy_RSI_SMA_RETURN(), df, symbol="BENCH", verbose=0)
+
+
+def _backtest_candle_frame(candles, df, directory):
+    # float32 candles, only the indicators the strategy reads are computed
+    return lambda: backtest(Strategy_RSI_SMA_RETURN(), CandleFrame.from_candles(candles), symbol="BENCH", verbose=0)
+
+
+def _plot_results(candles, df, directory):
+    result = backtest(Strategy_RSI_SMA_RETURN(), df, symbol="BENCH", verbose=0)
+    return lambda: plot_results(df, result.actual_trades, save_path=os.path.join(directory, "plots", "plot.png"))
+
+
+def _make_pdf(candles, df, directory):
+    result = backtest(Strategy_RSI_SMA_RETURN(), df, symbol="BENCH", verbose=0)
+    plot_path = os.path.join(directory, "plots", "plot.png")
+    plot_results(df, result.actual_trades, save_path=plot_path)
+    return lambda: make_pdf(actual_trades=result.actual_trades, texts=result.texts, symbol="BENCH",
+                            save_path_pdf=os.path.join(directory, "pdfs", "report.pdf"), save_path_plots=plot_path)
+
+
+def _lstm_inference(candles, df, directory):
+    from Datasets import FeatureDataset
+    from ModelRegistry import ModelRegistry
+    from Strategy_LSTM import Strategy_LSTM
+
+    # register an untrained model so the strategy loads it instead of training one, the weights do not matter for
+    # the speed
+    registry = ModelRegistry(root=os.path.join(directory, "models"))
+    dataset = FeatureDataset(lookback=1, cache_dir=None)
+    model = Strategy_LSTM.build_model(dataset.input_shape)
+    first, last = df.index[0], df.index[len(df) // 2]
+    registry.register("LSTM", model, {"symbol": "BENCH", "features": dataset.features, "lookback": 1,
+                                      "first_training_date": str(first), "last_training_date": str(last)})
+    strategy = Strategy_LSTM(first, last, df, lookback=1, symbol="BENCH", registry=registry)
+    strategy.model  # wait for the background loading
+
+    def run():
+        strategy.prediction_cache.clear()
+        strategy.predict_frame(df)
+    return run
+
+
+BENCHMARKS = [Benchmark("indicators_batch", _indicators_batch),
+              Benchmark("indicators_streaming", _indicators_streaming, max_bars=200_000),
+              Benchmark("strategy_action", _strategy_action, max_bars=20_000),
+              Benchmark("backtest", _backtest),
+              Benchmark("backtest_candle_frame", _backtest_candle_frame),
+              Benchmark("plot_results", _plot_results, max_bars=1_000_000, requires=("matplotlib",)),
+              Benchmark("make_pdf", _make_pdf, max_bars=1_000_000, requires=("matplotlib", "fpdf")),
+              Benchmark("lstm_inference", _lstm_inference, max_bars=1_000_000, requires=("tensorflow",))]
+
+
+def measure(function, repeat=3, memory=True):
+    """
+    Best time of repeat calls and the peak memory that is allocated during one call
+
+    Returns
+    -------
+    (float, float)
+        seconds and peak memory in MB, NaN if memory is False
+    """
+    seconds = np.inf
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        seconds = min(seconds, perf_counter() - start)
+
+    peak = np.nan
+    if memory:  # a separate call, tracing the allocations slows the code down
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def run_benchmarks(sizes=(10_000, 100_000), names=None, repeat=3, memory=True, seed=0, verbose=1):
+    """
+    Run the benchmarks on synthetic data of every size
+
+    Parameters
+    ----------
+
+    sizes : list of int
+        number of bars of the synthetic data
+
+    names : list of str
+        benchmarks to run, all if None
+
+    repeat : int
+        number of timed calls, the best one counts
+
+    memory : boolean
+        measure the peak memory in an extra call
+
+    seed : int
+        seed of the synthetic data
+
+    Returns
+    -------
+    pd.DataFrame
+        bars, seconds, bars per second and peak memory per benchmark and size
+    """
+    benchmarks = [benchmark for benchmark in BENCHMARKS if names is None or benchmark.name in names]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            candles = synthetic_candles(size, seed=seed)
+            df = indicator_frame(candles)
+            for benchmark in benchmarks:
+                if not benchmark.available():
+                    if verbose:
+                        print(f"{benchmark.name}: skipped, requires {', '.join(benchmark.requires)}")
+                    continue
+                bars = size if benchmark.max_bars is None else min(size, benchmark.max_bars)
+                function = benchmark.setup(candles[-bars:], df.iloc[-bars:], directory)
+                seconds, peak = measure(function, repeat=repeat, memory=memory)
+                results.append({"benchmark": benchmark.name, "bars": bars, "seconds": seconds,
+                                "bars/sec": bars / seconds, "peak MB": peak})
+                if verbose:
+                    print(f"{benchmark.name} ({bars} bars): {bars / seconds:,.0f} bars/sec, peak {peak:.1f} MB")
+    return pd.DataFrame(results)
+
+
+def load_baselines(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(results, path=BASELINE_PATH):
+    """
+    Store the results as baselines, existing baselines of other benchmarks and sizes are kept
+    """
+    baselines = load_baselines(path)
+    for row in results.to_dict("records"):
+        baselines[f"{row['benchmark']}/{row['bars']}"] = {"bars/sec": row["bars/sec"], "peak MB": row["peak MB"]}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+
+def compare(results, baselines, tolerance=0.2):
+    """
+    Compare results with the baselines, a benchmark regressed when its throughput is more than tolerance below the
+    baseline or its peak memory more than tolerance above it
+
+    Returns
+    -------
+    pd.DataFrame
+        the results with the baselines, the ratios to the baselines and whether they regressed
+    """
+    results = results.copy()
+    keys = results["benchmark"] + "/" + results["bars"].astype(str)
+    results["baseline bars/sec"] = [baselines.get(key, {}).get("bars/sec", np.nan) for key in keys]
+    results["baseline peak MB"] = [baselines.get(key, {}).get("peak MB", np.nan) for key in keys]
+    results["speed ratio"] = results["bars/sec"] / results["baseline bars/sec"]
+    results["memory ratio"] = results["peak MB"] / results["baseline peak MB"]
+    results["regression"] = (results["speed ratio"] < 1 - tolerance) | (results["memory ratio"] > 1 + tolerance)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the data, indicator, strategy and backtest hot paths")
+    parser.add_argument("--bars", type=int, nargs="+", default=[10_000, 100_000],
+                        help="sizes of the synthetic data, e.g., 10000 10000000")
+    parser.add_argument("--only", nargs="+", default=None, help="names of the benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="do not measure the peak memory")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baselines")
+    args = parser.parse_args()
+
+    results = run_benchmarks(sizes=args.bars, names=args.only, repeat=args.repeat, memory=not args.no_memory)
+    comparison = compare(results, load_baselines(), tolerance=args.tolerance)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(comparison)
+    if args.save_baseline:
+        save_baselines(results)
+    elif comparison["regression"].any():
+        raise SystemExit("performance regression: " + ", ".join(comparison.loc[comparison["regression"], "benchmark"]))
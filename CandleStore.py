@@ -0,0 +1,204 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class CandleStore(object):
+    """
+    Local on-disk store of the raw Coinbase candles, partitioned by symbol, granularity and day.
+
+    Every day is one .npy file holding a (6, n) float64 array with the columns time (epoch seconds), low, high,
+    open, close and volume stored contiguously, so the files can be memory-mapped and a single column read without
+    touching the others. The ranges that were fetched completely are kept in coverage.json next to the days, so
+    minutes without trades, for which the exchange has no candle, are not requested again.
+    """
+
+    columns = ["Time", "Low", "High", "Open", "Close", "Volume"]
+
+    def __init__(self, root="data/candles"):
+        self.root = root
+
+    def directory(self, symbol, granularity):
+        return os.path.join(self.root, symbol, str(granularity))
+
+    def path(self, symbol, granularity, day):
+        """
+        Path of the file of a day, where day is the number of days since the epoch
+        """
+        date = pd.to_datetime(day * SECONDS_PER_DAY, unit="s").strftime("%Y-%m-%d")
+        return os.path.join(self.directory(symbol, granularity), f"{date}.npy")
+
+    def days(self, symbol, granularity):
+        """
+        Sorted list of the days that are stored, as number of days since the epoch
+        """
+        directory = self.directory(symbol, granularity)
+        if not os.path.isdir(directory):
+            return []
+        dates = [name[:-len(".npy")] for name in os.listdir(directory) if name.endswith(".npy")]
+        return sorted(int(pd.Timestamp(date).value // 10 ** 9 // SECONDS_PER_DAY) for date in dates)
+
+    def load_day(self, symbol, granularity, day, mmap_mode="r"):
+        path = self.path(symbol, granularity, day)
+        if not os.path.exists(path):
+            return np.empty((6, 0))
+        return np.load(path, mmap_mode=mmap_mode)
+
+    def write(self, symbol, granularity, candles):
+        """
+        Merge candles into the store, candles that are already stored are overwritten
+
+        Parameters
+        ----------
+
+        symbol : str
+            symbol of the currency
+
+        granularity : int
+            seconds between the candles
+
+        candles : np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] as returned by the Coinbase Pro API
+        """
+        candles = np.asarray(candles, dtype=float).reshape(-1, 6)
+        if len(candles) == 0:
+            return
+        days = (candles[:, 0] // SECONDS_PER_DAY).astype(np.int64)
+        os.makedirs(self.directory(symbol, granularity), exist_ok=True)
+        for day in np.unique(days):
+            new = candles[days == day].T
+            merged = np.concatenate([new, self.load_day(symbol, granularity, day, mmap_mode=None)], axis=1)
+            # np.unique keeps the first occurrence, so the new candles win over the stored ones
+            _, first = np.unique(merged[0], return_index=True)
+            merged = np.ascontiguousarray(merged[:, first])
+
+            # write to a temporary file first so a crash never leaves a half written day behind
+            path = self.path(symbol, granularity, day)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, merged)
+            os.replace(tmp_path, path)
+
+    def read(self, symbol, granularity, start, end):
+        """
+        Read the stored candles with start <= time <= end
+
+        Parameters
+        ----------
+
+        start : float
+            epoch seconds
+
+        end : float
+            epoch seconds
+
+        Returns
+        -------
+        np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+        """
+        parts = []
+        for day in self.days(symbol, granularity):
+            if day < start // SECONDS_PER_DAY or day > end // SECONDS_PER_DAY:
+                continue
+            data = self.load_day(symbol, granularity, day)
+            parts.append(data[:, (data[0] >= start) & (data[0] <= end)])
+        if len(parts) == 0:
+            return np.empty((0, 6))
+        return np.concatenate(parts, axis=1).T
+
+    def last_time(self, symbol, granularity):
+        """
+        Time of the last stored candle in epoch seconds, None if nothing is stored
+        """
+        days = self.days(symbol, granularity)
+        if len(days) == 0:
+            return None
+        return float(self.load_day(symbol, granularity, days[-1])[0, -1])
+
+    def coverage_path(self, symbol, granularity):
+        return os.path.join(self.directory(symbol, granularity), "coverage.json")
+
+    def coverage(self, symbol, granularity):
+        """
+        Ranges that were fetched completely, whether the exchange had candles in them or not
+
+        Returns
+        -------
+        np.ndarray
+            (n, 2) array with the rows [start, end] in epoch seconds, sorted and not overlapping
+        """
+        path = self.coverage_path(symbol, granularity)
+        if not os.path.exists(path):
+            return np.empty((0, 2))
+        with open(path) as f:
+            return np.asarray(json.load(f), dtype=float).reshape(-1, 2)
+
+    def mark_covered(self, symbol, granularity, ranges):
+        """
+        Record ranges as fetched completely, ranges that overlap or follow each other are merged
+
+        Parameters
+        ----------
+
+        ranges : list of (float, float)
+            the (start, end) of every range in epoch seconds
+        """
+        ranges = np.concatenate([self.coverage(symbol, granularity), np.asarray(ranges, dtype=float).reshape(-1, 2)])
+        merged = []
+        for start, end in ranges[np.argsort(ranges[:, 0])].tolist():
+            if merged and start <= merged[-1][1] + granularity:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        os.makedirs(self.directory(symbol, granularity), exist_ok=True)
+        path = self.coverage_path(symbol, granularity)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(merged, f)
+        os.replace(tmp_path, path)
+
+    def missing(self, symbol, granularity, start, end, stored=None):
+        """
+        Ranges of the candle times with start <= time <= end that are neither stored nor covered
+
+        Parameters
+        ----------
+
+        start : float
+            epoch seconds
+
+        end : float
+            epoch seconds
+
+        stored : np.ndarray
+            the stored candles of the range if they were read already, they are read if None
+
+        Returns
+        -------
+        list of (float, float)
+            the (start, end) of every range in epoch seconds, sorted on time
+        """
+        first = np.ceil(start / granularity) * granularity
+        last = np.floor(end / granularity) * granularity
+        if last < first:
+            return []
+        stored = self.read(symbol, granularity, start, end) if stored is None else stored
+        times = np.arange(first, last + granularity, granularity)
+        known = np.isin(times, stored[:, 0])
+        coverage = self.coverage(symbol, granularity)
+        if len(coverage) > 0:
+            index = np.searchsorted(coverage[:, 0], times, side="right") - 1
+            known |= (index >= 0) & (times <= coverage[np.maximum(index, 0), 1])
+
+        missing = np.flatnonzero(~known)
+        if len(missing) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(missing) > 1)
+        starts = missing[np.concatenate([[0], breaks + 1])]
+        ends = missing[np.concatenate([breaks, [len(missing) - 1]])]
+        return [(float(times[i]), float(times[j])) for i, j in zip(starts, ends)]
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time as _time
+
+
+class Clock(object):
+    """
+    Wall clock, the default clock of the live trading code
+    """
+
+    def time(self):
+        return _time.time()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+    async def wait(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class AcceleratedClock(Clock):
+    """
+    Clock that starts at a given epoch time and runs speed times faster than the wall clock, to run the live engine
+    against a simulated exchange without waiting for real minutes
+    """
+
+    def __init__(self, start, speed=60.0):
+        """
+        Parameters
+        ----------
+
+        start : float
+            epoch seconds at which the clock starts
+
+        speed : float
+            number of clock seconds per wall clock second
+        """
+        self.start = start
+        self.speed = speed
+        self.wall_start = _time.monotonic()
+
+    def time(self):
+        return self.start + (_time.monotonic() - self.wall_start) * self.speed
+
+    def sleep(self, seconds):
+        _time.sleep(max(0.0, seconds) / self.speed)
+
+    async def wait(self, seconds):
+        await asyncio.sleep(max(0.0, seconds) / self.speed)
+
+
+class VirtualClock(Clock):
+    """
+    Clock that only moves when it is told to sleep, sleeping returns immediately and advances the time. Drives
+    CoinbaseBot.run over historical candles as fast as the decisions can be made.
+    """
+
+    def __init__(self, start):
+        self.now = start
+        self.lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now += max(0.0, seconds)
+
+    async def wait(self, seconds):
+        self.sleep(seconds)
+        await asyncio.sleep(0)
@@ -1,9 +1,12 @@
 import pandas as pd
 import numpy as np
-import warnings
-from ta.momentum import rsi
-from ta.trend import sma_indicator, ema_indicator
-from datetime import datetime, timedelta
+import threading
+from time import perf_counter
+from datetime import timedelta
+from Fetcher import HistoricRatesFetcher
+from Indicators import IndicatorEngine, IndicatorSpec, compute_indicators
+from MarketData import CandleBuffer, CandleResampler, RollingCandleBuffer
+from Metrics import metrics
 
 
 class CoinbaseAPI:
@@ -11,13 +14,90 @@ class CoinbaseAPI:
     API to retrieve trade data from Coinbase
     """
 
-    def __init__(self, client, symbol):
+    def __init__(self, client, symbol, indicator_spec=None, store=None, fetcher=None, max_candles=None,
+                 dtype=np.float64, timeframes=()):
+        """
+        Parameters
+        ----------
+
+        client : cbpro.PublicClient
+            client of the Coinbase Pro API
+
+        symbol : str
+            symbol of the currency, e.g., "BTC-EUR"
+
+        indicator_spec : IndicatorSpec
+            the indicator columns, the default spec if None
+
+        store : CandleStore
+            optional store to serve the history from
+
+        fetcher : HistoricRatesFetcher
+            fetcher of the candles, e.g., one that is shared by several symbols
+
+        max_candles : int
+            number of candles that are kept, all candles if None
+
+        dtype : np.dtype
+            dtype of the candle values
+
+        timeframes : iterable of int
+            higher timeframes in minutes, e.g., (5, 15, 60, 360, 1440), that are resampled from the 1-minute
+            candles, with their own indicators, as the minutes arrive
+        """
         self.client = client
         self.symbol = symbol
+        self.fetcher = HistoricRatesFetcher(client) if fetcher is None else fetcher
+        self.store = store  # optional CandleStore to serve the history from
+        self.indicator_spec = IndicatorSpec() if indicator_spec is None else indicator_spec
         self.cbpro_cols = ["Low", "High", "Open", "Close", "Volume"]
-        self.df = pd.DataFrame(columns=self.cbpro_cols)
+        self.max_candles = max_candles
+        self.dtype = dtype
+        self.candles = self.create_buffer()
+        self.indicators = None  # streaming indicators, only created once we receive updates
+        self.timeframe = "1m"
+        # the candles are appended in worker threads, e.g., by the candle task of the LiveEngine, while the
+        # strategy reads them on the event loop, so appends and reads of a window hold this lock
+        self.lock = threading.RLock()
+        self.timeframes = {}
+        for minutes in timeframes:
+            api = CoinbaseAPI(client, symbol, indicator_spec=indicator_spec, fetcher=self.fetcher,
+                              max_candles=max_candles, dtype=dtype)
+            api.timeframe = f"{minutes}m"
+            self.timeframes[minutes] = (CandleResampler(minutes * 60), api)
+
+    def create_buffer(self):
+        columns = self.cbpro_cols + self.indicator_spec.columns
+        # a bounded buffer keeps the memory constant for long running bots
+        if self.max_candles is None:
+            return CandleBuffer(columns, dtype=self.dtype)
+        return RollingCandleBuffer(columns, self.max_candles, dtype=self.dtype)
 
-    def get_minute_data(self, symbol=None, interval_min=1, lookback=24 * 60, max_requests=300):
+    def require(self, features, minutes=None):
+        """
+        Only compute the indicators that features need, e.g., the features of the strategy, and the ones they depend
+        on. Has to be called before the candles are loaded
+
+        Parameters
+        ----------
+
+        features : iterable of str
+            the columns that are used, e.g., ["RSI", "EMA50", "RSI_60m"], all indicators if None
+
+        minutes : int
+            timeframe of this API, None for the 1-minute candles
+        """
+        if features is None:
+            return
+        if len(self.candles) > 0:
+            raise ValueError("the features have to be set before the candles are loaded")
+        self.indicator_spec = IndicatorSpec.for_features(features, rsi_window=self.indicator_spec.rsi_window,
+                                                         minutes=minutes)
+        self.candles = self.create_buffer()
+        for timeframe, (_, api) in self.timeframes.items():
+            api.require(features, minutes=timeframe)
+
+    def get_minute_data(self, symbol=None, interval_min=1, lookback=24 * 60, max_requests=300, closed_only=False):
         """
         Method to obtain minute data from the Coinbase Pro API
 
@@ -37,6 +117,9 @@ class CoinbaseAPI:
         max_requests : int
             The max number of timestamps you can request per time
 
+        closed_only : boolean
+            leave out the candle of the current interval, it still changes
+
         Returns
         -------
         Pandas Dataframe
@@ -46,74 +129,245 @@ class CoinbaseAPI:
         self.symbol = symbol if symbol is not None else self.symbol
 
         interval_sec = interval_min * 60  # interval in seconds
+        metrics.increment("api_calls", endpoint="time")
         end = pd.to_datetime(self.client.get_time()["epoch"], unit="s")  # end date
+        if closed_only:
+            end -= timedelta(seconds=interval_sec)
         start = end - timedelta(minutes=lookback)  # start date
-        delta = timedelta(minutes=min(lookback, max_requests) * interval_min)  # time between each timestamp
-        n_timestamps = int(lookback / interval_min)
-        current_start = start
-        current_end = -1
-        new_df = pd.DataFrame()
+        if self.store is not None:
+            candles = self.sync_candles(start, end, interval_min=interval_min, max_requests=max_requests)
+        else:
+            candles = self.fetch_candles(start, end, interval_min=interval_min, max_requests=max_requests)
+
+        self.append_candles(candles)
+        return self.df
+
+    @property
+    def df(self):
+        """
+        DataFrame with the candles and their indicators, indexed on the time in the netherlands
+        """
+        return self.to_frame()
+
+    def timeframe_api(self, minutes):
+        """
+        CoinbaseAPI with the candles and indicators of a higher timeframe, e.g., timeframe_api(60).df
+        """
+        return self.timeframes[minutes][1]
+
+    def to_frame(self, window=None):
+        """
+        DataFrame with the last window candles, all candles if None, and the columns of the higher timeframes named
+        like RSI_60m. Every minute has the values of the last candle of each timeframe that had closed at the end of
+        that minute, so there is no look-ahead
+        """
+        with self.lock:
+            start = 0 if window is None else -window
+            df = self.candles.to_frame(start)
+            if len(self.timeframes) == 0:
+                return df
+
+            times = self.candles.view(start).times
+            columns = {}
+            for minutes, (_, api) in self.timeframes.items():
+                higher = api.candles.view()
+                positions = np.searchsorted(higher.times + minutes * 60, times + 60, side="right") - 1
+                for column in api.candles.columns:
+                    values = np.full(len(times), np.nan)
+                    values[positions >= 0] = higher.column(column)[positions[positions >= 0]]
+                    columns[f"{column}_{minutes}m"] = values
+            return pd.concat([df, pd.DataFrame(columns, index=df.index)], axis=1)
+
+    def frame(self, window=None):
+        """
+        CandleFrame on the candles and their indicators without copying them, e.g., to backtest on the candles of
+        the bot. With a bounded buffer it is only valid until the next update
+
+        Parameters
+        ----------
+
+        window : int
+            only the last window candles, all candles if None
+        """
+        return self.candles.view() if window is None else self.candles.view(-window)
+
+    def append_candles(self, candles):
+        """
+        Method to add the indicators to raw candles and append the ones after the last stored candle
+
+        Parameters
+        ----------
+
+        candles : np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+
+        Returns
+        -------
+        int
+            number of candles that were appended
+        """
+
+        with self.lock:
+            # drop the candles we already have
+            if len(self.candles) > 0:
+                candles = candles[candles[:, 0] > self.candles.last_time]
+            if len(candles) == 0:
+                return 0
+
+            mode = "streaming" if len(self.candles) > 0 else "batch"
+            start = perf_counter()
+            if len(self.candles) > 0:
+                # only the new candles need their indicators, the streaming engine continues where the history stopped
+                if self.indicators is None:
+                    self.indicators = IndicatorEngine(self.indicator_spec)
+                    self.indicators.seed(self.candles.column("Close"))
+                indicators = [self.indicators.update(close) for close in candles[:, 4]]
+            else:
+                new_df = pd.DataFrame(candles[:, 1:], columns=self.cbpro_cols)
+                indicators = compute_indicators(new_df, self.indicator_spec)[self.indicator_spec.columns].to_numpy()
+                if isinstance(self.candles, RollingCandleBuffer):
+                    # seed now, a bounded buffer may not keep enough history to seed the indicators later
+                    self.indicators = IndicatorEngine(self.indicator_spec)
+                    self.indicators.seed(candles[:, 4])
+
+            metrics.observe("indicators", perf_counter() - start, mode=mode)
+
+            values = np.column_stack([candles[:, 1:], np.asarray(indicators, dtype=float)])
+            appended = self.candles.append(candles[:, 0], values)
+            for resampler, api in self.timeframes.values():
+                api.append_candles(resampler.update(candles))
+            metrics.set("candles", len(self.candles), symbol=self.symbol, timeframe=self.timeframe)
+            return appended
+
+    def fetch_candles(self, start, end, interval_min=1, max_requests=300):
+        """
+        Method to fetch the raw candles between start and end from the Coinbase Pro API, the pages of max_requests
+        candles are requested in parallel by the fetcher
+
+        Parameters
+        ----------
+
+        start : pd.Timestamp
+            start date in UTC
+
+        end : pd.Timestamp
+            end date in UTC
+
+        interval_min : int
+                The interval in minutes between the retrieved timestamps
+
+        max_requests : int
+            The max number of timestamps you can request per time
+
+        Returns
+        -------
+        np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+        """
+
+        try:
+            return self.fetcher.fetch(self.symbol, start.timestamp(), end.timestamp(), granularity=interval_min * 60,
+                                      max_requests=max_requests)
+        except RuntimeError as e:
+            print("ERROR:")
+            print(e)  # should print what error we got
+            return np.empty((0, 6))
+
+    def sync_candles(self, start, end, interval_min=1, max_requests=300):
+        """
+        Method to serve the candles between start and end from the candle store, only the ranges the store neither
+        holds candles of nor covers are fetched from the Coinbase Pro API, in one paged request, and added to the store
+
+        Returns
+        -------
+        np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+        """
+
+        interval_sec = interval_min * 60
+        start_sec, end_sec = start.timestamp(), end.timestamp()
+        stored = self.store.read(self.symbol, interval_sec, start_sec, end_sec)
+        missing = self.store.missing(self.symbol, interval_sec, start_sec, end_sec, stored=stored)
+        if len(missing) == 0:
+            return stored
+
         try:
-            # one request can only retrieve up to max_requests timestamps: use for loop to obtain the desired range with
-            # multiple requests
-            dataframes = []
-            for i in range(int(n_timestamps / max_requests)):
-                current_end = current_start + delta
-                dataframes.append(pd.DataFrame(
-                    self.client.get_product_historic_rates(self.symbol, current_start.isoformat(), current_end.isoformat(),
-                                                           interval_sec))[::-1])
-                current_start = current_end
-            dataframes.append(pd.DataFrame(
-                self.client.get_product_historic_rates(self.symbol, current_start.isoformat(), end, interval_sec))[::-1])
-            new_df = pd.concat(dataframes)
-        except RuntimeError:
+            fetched = self.fetcher.fetch_ranges(self.symbol, missing, granularity=interval_sec,
+                                                max_requests=max_requests)
+        except RuntimeError as e:
             print("ERROR:")
-            print(self.client.get_product_historic_rates(self.symbol, current_start.isoformat(), current_end.isoformat(),
-                                                         interval_sec))  # should print what error we got
-        # check whether the new dataframe is empty or not
-        if len(new_df) == 0:
-            return self.df.copy()
-
-        # clean dataframe
-        new_df.columns = ["Time", "Low", "High", "Open", "Close", "Volume"]
-        new_df = new_df.astype(float)
-        new_df = new_df.set_index("Time")
-        new_df.index = pd.to_datetime(new_df.index, unit="s")
-        new_df.index = new_df.index + timedelta(hours=1)  # time in netherlands
-        new_df = pd.concat([self.df[self.cbpro_cols], new_df])
-
-        # add some measures
-        new_df['RSI'] = rsi(new_df.Close, window=10)
-        new_df['SMA200'] = sma_indicator(new_df.Close, window=200)
-        new_df['EMA200'] = ema_indicator(new_df.Close, window=200)
-        new_df['SMA100'] = sma_indicator(new_df.Close, window=100)
-        new_df['EMA100'] = ema_indicator(new_df.Close, window=100)
-        new_df['SMA50'] = sma_indicator(new_df.Close, window=50)
-        new_df['EMA50'] = ema_indicator(new_df.Close, window=50)
-        new_df['SMA60'] = sma_indicator(new_df.Close, window=60)
-        new_df['EMA60'] = ema_indicator(new_df.Close, window=60)
-
-        new_df["pct change"] = new_df.Close.pct_change() + 1
-        new_df["CUM_RETURNS_50"] = (new_df.Close.pct_change() + 1).rolling(50).apply(np.prod)
-        new_df["CUM_RETURNS_60"] = (new_df.Close.pct_change() + 1).rolling(60).apply(np.prod)
-        new_df["CUM_RETURNS_100"] = (new_df.Close.pct_change() + 1).rolling(100).apply(np.prod)
-
-        self.df = pd.concat([self.df, new_df])
-        return self.df.copy()
-
-    #TODO fix update_minute data
-    def update_minute_data(self):
-        """
-        Method to update the minute data from the Coinbase Pro API
-        """
-
-        current_time = datetime.now()
-        time_diff = current_time - self.df.index[-1]
-        time_diff_mins = int(time_diff.seconds / 60)
-        if time_diff_mins <= 0:  # now new update required
-            return self.df.copy()
+            print(e)  # nothing is marked as covered, so the ranges are requested again by the next sync
+            return stored
+        self.store.write(self.symbol, interval_sec, fetched)
+
+        # the exchange has no candle for a minute without trades, so a successful reply covers its ranges up to the
+        # last known candle, even when it is empty. Later minutes may still get a candle that is not published yet
+        latest = max(stored[-1, 0] if len(stored) > 0 else -np.inf, fetched[-1, 0] if len(fetched) > 0 else -np.inf)
+        self.store.mark_covered(self.symbol, interval_sec,
+                                [(range_start, min(range_end, latest)) for range_start, range_end in missing
+                                 if range_start <= latest])
+
+        candles = np.concatenate([stored, fetched])
+        _, last = np.unique(candles[::-1, 0], return_index=True)  # the fetched candles win over the stored ones
+        return candles[::-1][last]
+
+    def update_candles(self, closed_only=False, now=None):
+        """
+        Method to fetch the minutes after the last candle from the Coinbase Pro API and append them
+
+        Parameters
+        ----------
+
+        closed_only : boolean
+            only append the candles of minutes that have ended, the candle of the current minute still changes
+
+        now : float
+            exchange time in epoch seconds, requested from the exchange if None. Passing it lets one time request
+            serve the updates of several symbols
+
+        Returns
+        -------
+        int
+            number of candles that were appended
+        """
+
+        if len(self.candles) == 0:
+            self.get_minute_data(interval_min=1, closed_only=closed_only)
+            return len(self.candles)
+
+        if now is None:
+            metrics.increment("api_calls", endpoint="time")
+            now = self.client.get_time()["epoch"]  # exchange time, the candles are in UTC as well
+        if closed_only:
+            now -= 60  # the start of the last minute that has ended
+        start = self.candles.last_time + 60
+        if now < start:  # no new update required
+            return 0
+
+        start, end = pd.to_datetime(start, unit="s"), pd.to_datetime(now, unit="s")
+        if self.store is not None:
+            candles = self.sync_candles(start, end, interval_min=1)
         else:
-            self.df = self.get_minute_data(interval_min=1, lookback=time_diff_mins)
-            return self.df.copy()
+            candles = self.fetch_candles(start, end, interval_min=1)
+        return self.append_candles(candles)
+
+    def update_minute_data(self, window=None):
+        """
+        Method to update the minute data from the Coinbase Pro API, only the minutes after the last candle are
+        fetched and appended. Only minutes that have ended are appended: a candle is never updated once it is
+        appended, so the candle of the current minute would keep its partial values, in the indicators too
+
+        Parameters
+        ----------
 
+        window : int
+            only return the last window candles, all candles if None
+
+        Returns
+        -------
+        Pandas Dataframe
+            a dataframe with the trade data
+        """
 
+        self.update_candles(closed_only=True)
+        return self.to_frame(window)
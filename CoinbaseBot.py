@@ -1,34 +1,49 @@
 import cbpro
 import json
+from collections import deque
 from Strategy_Base import Strategy
 from strategies.Strategy_RSI_SMA_RETURN import Strategy_RSI_SMA_RETURN
 from CoinbaseAPI import CoinbaseAPI
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-from time import time, sleep
+from CandleStore import CandleStore
+from TradeJournal import TradeJournal
+from Clock import Clock
+from Metrics import metrics
+from time import perf_counter
 from Utils import convert_time_to_str
 
 
 class CoinbaseBot(object):
 
-    def __init__(self, client, capital, product_id='BTC-EUR'):
+    def __init__(self, client, capital, product_id='BTC-EUR', store=None, max_candles=24 * 60, fetcher=None,
+                 clock=None, timeframes=(), journal=None, record_ticks=False):
         self.client = client
+        self.clock = Clock() if clock is None else clock  # a VirtualClock replays the history
         self.product_id = product_id
         self.capital = capital
-        self.api = CoinbaseAPI(client=self.client, symbol=self.product_id)
+        # the strategy also gets the columns of the higher timeframes, e.g., RSI_60m for timeframes=(60,)
+        self.api = CoinbaseAPI(client=self.client, symbol=self.product_id, store=store, fetcher=fetcher,
+                               max_candles=max_candles, timeframes=timeframes)
         self.df_trades_dict = {"Buy date": [],
                                "Buy price": [],
-                               "Buy Size": [],
+                               "Buy size": [],
                                "Buy ID": [],
                                "Sell date": [],
                                "Sell price": [],
+                               "Sell size": [],
                                "Sell ID": [],
                                "Start capital": [],
                                "End capital": [],
                                "Return": [],
                                "Profit": [],
                                "Product ID": []}
+        # time, state, action and decision latency of the iterations of run, all of them when recorded, e.g., to
+        # replay them against the backtest, otherwise only the last day so a long running bot keeps its memory
+        self.ticks = [] if record_ticks else deque(maxlen=24 * 60)
+        self.journal = journal  # TradeJournal the order events and trades are appended to as they happen
+
+    def record_order(self, order, event):
+        if self.journal is not None:
+            self.journal.record_order(order, event, product_id=self.product_id, time=self.clock.time())
 
     def get_n_orders(self):
         return len(self.client.get_orders())
@@ -43,8 +58,10 @@ class CoinbaseBot(object):
     def place_buy_order(self, row, price=None, size=None, price_multiplier=0.97, verbose=1):
         price = round(row.Close * price_multiplier, 2) if price is None else price
         size = round(self.capital / price, 6) if size is None else size
-        order = self.client.place_limit_order(product_id=self.product_id, side="buy", price=price,
-                                              size=size)
+        metrics.increment("api_calls", endpoint="place_limit_order")
+        with metrics.timer("place_order", side="buy"):
+            order = self.client.place_limit_order(product_id=self.product_id, side="buy", price=price,
+                                                  size=size)
         # stats
         if verbose:
             print("Placed BUY order with the following details:")
@@ -55,8 +72,10 @@ class CoinbaseBot(object):
     def place_sell_order(self, row, price=None, size=None, price_multiplier=0.995, verbose=1):
         price = round(row.Close, 2) if price is None else price
         size = -1 if size is None else size  # TODO: fix this
-        order = self.client.place_limit_order(product_id=self.product_id, side="sell", price=price,
-                                              size=size)
+        metrics.increment("api_calls", endpoint="place_limit_order")
+        with metrics.timer("place_order", side="sell"):
+            order = self.client.place_limit_order(product_id=self.product_id, side="sell", price=price,
+                                                  size=size)
 
         # stats
         if verbose:
@@ -81,19 +100,21 @@ class CoinbaseBot(object):
         """
         Update the order trades dict after buying and selling
         """
-        self.df_trades_dict['Start capital'].append(self.df_trades_dict['Buy size'] * self.df_trades_dict['Buy price'])
-        self.df_trades_dict['End capital'].append(self.df_trades_dict['Sell size'] * self.df_trades_dict['Sell price'])
-        self.df_trades_dict['Profit'].append(self.df_trades_dict['Sell size'] - self.df_trades_dict['Buy price'])
-        self.df_trades_dict['Return'].append((self.df_trades_dict['Sell size'] - self.df_trades_dict['Buy price'])
-                                             / self.df_trades_dict['Buy price'])
-
-    def save_trades(self, path='Trades.csv'):
-        df = pd.DataFrame.from_dict(self.df_trades_dict)
-        df['Product ID'] = self.product_id
-        df.to_csv(path, mode='a')
+        buy_size = float(self.df_trades_dict['Buy size'][-1])
+        buy_price = float(self.df_trades_dict['Buy price'][-1])
+        sell_size = float(self.df_trades_dict['Sell size'][-1])
+        sell_price = float(self.df_trades_dict['Sell price'][-1])
+        self.df_trades_dict['Start capital'].append(buy_size * buy_price)
+        self.df_trades_dict['End capital'].append(sell_size * sell_price)
+        self.df_trades_dict['Profit'].append(sell_size * sell_price - buy_size * buy_price)
+        self.df_trades_dict['Return'].append((sell_price - buy_price) / buy_price)
+        self.df_trades_dict['Product ID'].append(self.product_id)
+        if self.journal is not None:
+            trade = {key: values[-1] for key, values in self.df_trades_dict.items()}
+            self.journal.record_trade(trade, time=self.clock.time())
 
     def run(self, strategy: Strategy, product_id=None, entried=False, lookback=60 * 2,
-            running_time=60 * 2, cancel_time=30):
+            running_time=60 * 2, cancel_time=30, window=200, save=True, verbose=1, metrics_path=None):
         """
         Main to run the trading bot
 
@@ -122,6 +143,19 @@ class CoinbaseBot(object):
         cancel_time: float
             time we can wait before we cancel a buy/sell order in minutes
 
+        window: int
+            number of most recent candles that are given to the strategy
+
+        save: boolean
+            append the order events and trades to the journal of the bot as they happen, to a TradeJournal in
+            data/trades.sqlite if the bot has none
+
+        verbose: int
+            print the action of every minute and the orders
+
+        metrics_path: str
+            JSONL file to which a snapshot of the metrics is appended every minute
+
         Returns
         -------
 
@@ -130,71 +164,109 @@ class CoinbaseBot(object):
 
         """
 
-        # Obtain and initialize the data
-        self.api.get_minute_data(interval_min=1, lookback=lookback)
+        if save and self.journal is None:
+            self.journal = TradeJournal()
+
+        # Obtain and initialize the data, with only the indicators the strategy reads
+        if len(self.api.candles) == 0:
+            self.api.require(strategy.features)
+        self.api.get_minute_data(interval_min=1, lookback=lookback, closed_only=True)
 
         # Initialization
-        start_time = time()
+        start_time = self.clock.time()
         last_buying_price = -1
         product_id = product_id if product_id is not None else self.product_id
         order = None
+        prev_order = None
 
         # check the running time
-        while (time() - start_time) / 60 < running_time:
+        while (self.clock.time() - start_time) / 60 < running_time:
 
-            df = self.api.update_minute_data()
+            tick_start = perf_counter()
+            with metrics.timer("data_update"):
+                df = self.api.update_minute_data(window=window)  # a new frame with only the last candles
             last_row = df.iloc[-1, :].copy()
             df["last_buying_price"] = last_buying_price
-            action = strategy.action(df.copy(), entried=entried)
-            current_time_str = convert_time_to_str(time())
-            print("Time: %s, Entried: %s, Action: %s" % (str(current_time_str), entried, action))
+            with metrics.timer("strategy_action"):
+                action = strategy.action(df, entried=entried)
+            latency = perf_counter() - tick_start
+            metrics.observe("decision", latency)
+            metrics.set("frame_rows", len(df))
+            metrics.set("frame_bytes", int(df.memory_usage(index=True).sum()))
+            self.ticks.append({"Time": df.index[-1], "Entried": entried, "Last buying price": last_buying_price,
+                               "Action": action, "Latency": latency})
+            current_time_str = convert_time_to_str(self.clock.time())
+            if verbose:
+                print("Time: %s, Entried: %s, Action: %s" % (str(current_time_str), entried, action))
 
             # BUYING and SELLING:
             # ------------------------------------------------------------------------------------------------------
             try:
                 if order is None:  # no order placed yet
-                    order_time = time()
+                    order_time = self.clock.time()
                     if not entried and action == "BUY":  # try to buy
-                        order = self.place_buy_order(last_row)
+                        order = self.place_buy_order(last_row, verbose=verbose)
                     elif entried and action == "SELL":  # try to sell
-                        order = self.place_sell_order(last_row, size=round(prev_order['size'], 6))
+                        order = self.place_sell_order(last_row, size=round(float(prev_order['size']), 6),
+                                                      verbose=verbose)
+                    if order is not None:
+                        self.record_order(order, "placed" if "id" in order else "rejected")
+                    if order is not None and "id" not in order:  # rejected, e.g., insufficient funds
+                        order = None
 
                 else:  # check whether the order is done
-                    order = client.get_order(order_id=order['id'])
+                    metrics.increment("api_calls", endpoint="get_order")
+                    with metrics.timer("poll_order"):
+                        order = self.client.get_order(order_id=order['id'])
                     prev_order = order.copy()  # remember the previous order
                     if order['status'] == 'done':
+                        metrics.increment("fills", side=order['side'])
+                        self.record_order(order, "done")
                         if order['side'] == 'buy':  # we bought
                             entried = True
-                            last_buying_price = order['price']
+                            last_buying_price = float(order['price'])
                             self.update_buy_order(order)
                         elif order['side'] == 'sell':  # we sold
                             entried = False
-                            self.capital = self.get_balance()
+                            self.capital = float(self.get_balance())
                             self.update_sell_order(order)
                             self.update_final_order()
 
                         order = None  # reset the order
 
-                    if (time() - order_time) / 60 > cancel_time:
-                        print("Canceled BUY order with the following details:")
-                        print(order)
+                    elif (self.clock.time() - order_time) / 60 > cancel_time:
+                        if verbose:
+                            print("Canceled BUY order with the following details:")
+                            print(order)
+                        metrics.increment("api_calls", endpoint="cancel_order")
+                        metrics.increment("cancels", side=order['side'])
                         self.client.cancel_order(order["id"])
+                        self.record_order(order, "canceled")
                         order = None
 
             except Exception as e:
+                metrics.increment("errors")
                 print("An error had occured: ")
                 print(e)
 
-            sleep(60)  # ensure we do not send too many requests to the server
+            metrics.observe("tick", perf_counter() - tick_start)
+            if metrics_path is not None:
+                metrics.dump_jsonl(metrics_path)
+
+            self.clock.sleep(60)  # ensure we do not send too many requests to the server
 
         # out of the while loop so...
-        self.save_trades()
-        if prev_order['side'] == 'buy' and prev_order["status"] != "done":
+        if prev_order is not None and prev_order['side'] == 'buy' and prev_order["status"] != "done":
             self.client.cancel_order(prev_order["id"])
+            self.record_order(prev_order, "canceled")
 
-        if prev_order['side'] == 'sell' and prev_order["status"] != "done":
+        if prev_order is not None and prev_order['side'] == 'sell' and prev_order["status"] != "done":
             self.client.cancel_order(prev_order["id"])
-            self.client.place_market_order(product_id, side="sell", size=prev_order['size'])
+            self.record_order(prev_order, "canceled")
+            order = self.client.place_market_order(product_id, side="sell", size=prev_order['size'])
+            self.record_order(order, "placed" if "id" in order else "rejected")
+        if self.journal is not None:
+            self.journal.sync()
 
         print("Reached end of the allowed running time")
 
@@ -208,5 +280,5 @@ if __name__ == "__main__":
         config = json.load(json_data_file)
     client = cbpro.AuthenticatedClient(config["api_public"], config["api_secret"], config["passphrase"])
 
-    bot = CoinbaseBot(client=client, product_id='BTC-EUR', capital=100)
+    bot = CoinbaseBot(client=client, product_id='BTC-EUR', capital=100, store=CandleStore())
     bot.run(strategy=Strategy_RSI_SMA_RETURN(), running_time=720)
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class FeatureDataset(object):
+    """
+    Builds windowed training arrays from a dataframe with candles and indicators. Every sample is a window of the
+    last lookback rows of the features with as label the target horizon rows after the end of the window. The arrays
+    are float32, contiguous and cached on disk, so repeated training runs skip the preprocessing.
+    """
+
+    def __init__(self, features=('Close', 'SMA50', 'SMA200', 'Volume'), lookback=1, target='Close', horizon=-1,
+                 cache_dir='data/datasets'):
+        """
+        Parameters
+        ----------
+
+        features : list of str
+            columns used as input
+
+        lookback : int
+            number of rows in a window
+
+        target : str
+            column used as label
+
+        horizon : int
+            offset of the label from the last row of the window, e.g., -1 predicts the close of the row before the
+            window end and 1 the close of the next row
+
+        cache_dir : str
+            directory of the cached arrays, no caching if None
+        """
+        self.features = list(features)
+        self.lookback = lookback
+        self.target = target
+        self.horizon = horizon
+        self.cache_dir = cache_dir
+
+    @property
+    def input_shape(self):
+        return self.lookback, len(self.features)
+
+    def spec(self):
+        return {"features": self.features, "lookback": self.lookback, "target": self.target, "horizon": self.horizon}
+
+    def feature_windows(self, df):
+        """
+        Window of features ending at every row from row lookback - 1 on, as a view without copying
+
+        Returns
+        -------
+        np.ndarray
+            (len(df) - lookback + 1, lookback, n_features) float32 array
+        """
+        values = np.ascontiguousarray(df[self.features].to_numpy(dtype=np.float32))
+        if len(values) < self.lookback:
+            return np.empty((0,) + self.input_shape, dtype=np.float32)
+        return sliding_window_view(values, self.input_shape)[:, 0]
+
+    def samples(self, df):
+        """
+        All samples of df without NaNs
+
+        Returns
+        -------
+        (np.ndarray, np.ndarray, pd.DatetimeIndex)
+            the windows, the labels and the dates of the labels
+        """
+        windows = self.feature_windows(df)
+        labels = df[self.target].to_numpy(dtype=np.float32)
+        label_rows = np.arange(len(windows)) + self.lookback - 1 + self.horizon
+        valid = (label_rows >= 0) & (label_rows < len(df))
+        windows, label_rows = windows[valid], label_rows[valid]
+        y = labels[label_rows]
+        complete = ~np.isnan(windows).any(axis=(1, 2)) & ~np.isnan(y)
+        return windows[complete], y[complete], df.index[label_rows[complete]]
+
+    def cache_path(self, symbol, df):
+        """
+        Cache directory of the samples of df, keyed on the symbol, the date range of df and the feature spec
+        """
+        key = json.dumps({"symbol": symbol, "first": str(df.index[0]), "last": str(df.index[-1]), "rows": len(df),
+                          **self.spec()}, sort_keys=True)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def build(self, df, first_date=None, last_date=None, symbol=''):
+        """
+        Training arrays of the samples whose label date is between first_date and last_date (inclusive), loaded
+        memory-mapped from the cache when they were built before
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame
+            dataframe with the features and the target, also the rows before first_date are used for the windows
+
+        first_date, last_date : str or pd.Timestamp
+            date range of the labels, open ended if None
+
+        symbol : str
+            symbol of the currency, part of the cache key
+
+        Returns
+        -------
+        (np.ndarray, np.ndarray)
+            (n, lookback, n_features) inputs and (n,) labels
+        """
+        if self.cache_dir is not None and len(df) > 0:
+            path = self.cache_path(symbol, df)
+            selection = f"{first_date}__{last_date}".replace(":", "-").replace(" ", "_")
+            x_path, y_path = os.path.join(path, f"X_{selection}.npy"), os.path.join(path, f"Y_{selection}.npy")
+            if os.path.exists(x_path) and os.path.exists(y_path):
+                return np.load(x_path, mmap_mode="r"), np.load(y_path, mmap_mode="r")
+
+        x, y, dates = self.samples(df)
+        selected = dates.slice_indexer(first_date, last_date)
+        x, y = np.ascontiguousarray(x[selected]), np.ascontiguousarray(y[selected])
+
+        if self.cache_dir is not None and len(df) > 0:
+            os.makedirs(path, exist_ok=True)
+            np.save(x_path, x)
+            np.save(y_path, y)
+        return x, y
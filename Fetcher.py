@@ -0,0 +1,215 @@
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+
+import numpy as np
+import pandas as pd
+
+from Metrics import metrics
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket rate limiter: allows bursts of capacity requests and rate requests per second on average
+    """
+
+    def __init__(self, rate=3, capacity=6, clock=None):
+        """
+        Parameters
+        ----------
+
+        rate : float
+            number of tokens added per second, Coinbase Pro allows 3 public requests per second
+
+        capacity : int
+            maximum number of tokens that can be saved up for a burst
+
+        clock : Clock
+            clock the rate is measured in, e.g., the AcceleratedClock of a simulated exchange, the wall clock if None
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.time = monotonic if clock is None else clock.time
+        self.sleep = sleep if clock is None else clock.sleep
+        self.last = self.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and take it
+        """
+        while True:
+            with self.lock:
+                now = self.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            metrics.observe("rate_limit_wait", wait)
+            self.sleep(wait)
+
+
+class HistoricRatesFetcher(object):
+    """
+    Fetches historic rates in pages of at most max_requests candles, with the pages requested in parallel
+    """
+
+    def __init__(self, client, rate_limiter=None, max_workers=4, retries=3, backoff=0.5, max_requests=300):
+        """
+        Parameters
+        ----------
+
+        client : cbpro.PublicClient
+            client with the get_product_historic_rates method
+
+        rate_limiter : TokenBucket
+            rate limiter every request has to pass, can be shared between fetchers. The backoff of the retries is
+            slept on its clock
+
+        max_workers : int
+            number of pages that are requested at the same time
+
+        retries : int
+            number of times a failed page is requested again
+
+        backoff : float
+            seconds to wait before the first retry, doubled at every next retry
+
+        max_requests : int
+            The max number of timestamps you can request per time
+        """
+        self.client = client
+        self.rate_limiter = TokenBucket() if rate_limiter is None else rate_limiter
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_requests = max_requests
+
+    def fetch_page(self, symbol, start, end, granularity):
+        """
+        Request one page of candles, retrying with exponential backoff when the request fails
+
+        Returns
+        -------
+        np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] as returned by the API
+        """
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                metrics.increment("api_retries", endpoint="historic_rates")
+                self.rate_limiter.sleep(self.backoff * 2 ** (attempt - 1))
+            self.rate_limiter.acquire()
+            metrics.increment("api_calls", endpoint="historic_rates")
+            try:
+                with metrics.timer("api_call", endpoint="historic_rates"):
+                    response = self.client.get_product_historic_rates(
+                        symbol, pd.to_datetime(start, unit="s").isoformat(),
+                        pd.to_datetime(end, unit="s").isoformat(), granularity)
+            except Exception as e:  # connection errors, timeouts...
+                metrics.increment("api_errors", endpoint="historic_rates")
+                error = e
+                continue
+            if isinstance(response, list):
+                return np.asarray(response, dtype=float).reshape(-1, 6)
+            metrics.increment("api_errors", endpoint="historic_rates")
+            error = response  # the API returns a dict with a message on errors, e.g., when rate limited
+        raise RuntimeError(f"failed to fetch {symbol} candles from {start} to {end}: {error}")
+
+    def fetch(self, symbol, start, end, granularity=60, max_requests=None):
+        """
+        Fetch all candles with start <= time <= end
+
+        Parameters
+        ----------
+
+        symbol : str
+            symbol of the currency
+
+        start : float
+            epoch seconds
+
+        end : float
+            epoch seconds
+
+        granularity : int
+            seconds between the candles
+
+        max_requests : int
+            candles per page, the one of the fetcher if None
+
+        Returns
+        -------
+        np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+        """
+        return self.fetch_ranges(symbol, [(start, end)], granularity=granularity, max_requests=max_requests)
+
+    def fetch_ranges(self, symbol, ranges, granularity=60, max_requests=None):
+        """
+        Fetch all candles with start <= time <= end of several ranges, e.g., the holes in a store, with the pages of
+        all ranges requested in parallel. Ranges that fit in one page together are requested in one page
+
+        Parameters
+        ----------
+
+        symbol : str
+            symbol of the currency
+
+        ranges : list of (float, float)
+            the (start, end) of every range in epoch seconds
+
+        granularity : int
+            seconds between the candles
+
+        max_requests : int
+            candles per page, the one of the fetcher if None
+
+        Returns
+        -------
+        np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+        """
+        max_requests = self.max_requests if max_requests is None else max_requests
+        page_span = max_requests * granularity
+        merged = []
+        for start, end in sorted(ranges):
+            start = math.ceil(start / granularity) * granularity  # candles are aligned on the granularity
+            if end < start:
+                continue
+            if merged and end - merged[-1][0] < page_span:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        pages = []
+        for first, end in merged:
+            n_pages = max(0, math.ceil((end - first + 1) / page_span))
+            pages += [(first + page * page_span, min(first + (page + 1) * page_span - granularity, end))
+                      for page in range(n_pages)]
+
+        # every page writes its candles into its own block of the preallocated array
+        candles = np.full((len(pages) * max_requests, 6), np.nan)
+
+        def fetch_into(page):
+            page_start, page_end = pages[page]
+            rows = self.fetch_page(symbol, page_start, page_end, granularity)[:max_requests]
+            offset = page * max_requests
+            candles[offset:offset + len(rows)] = rows
+
+        with metrics.timer("fetch"):
+            if len(pages) == 1:  # the per-minute updates, not worth starting threads for
+                fetch_into(0)
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                    for future in [pool.submit(fetch_into, page) for page in range(len(pages))]:
+                        future.result()  # raises the error of a failed page
+
+        candles = candles[~np.isnan(candles[:, 0])]
+        # the API returns the newest candles first; sort and drop duplicated timestamps
+        _, first_index = np.unique(candles[:, 0], return_index=True)
+        metrics.increment("candles_fetched", len(first_index))
+        return candles[first_index]
@@ -0,0 +1,391 @@
+import math
+import re
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from ta.momentum import rsi
+from ta.trend import sma_indicator, ema_indicator
+
+
+class IndicatorSpec(object):
+    """
+    Specification of the indicator columns that are added to the candles
+    """
+
+    def __init__(self, rsi_window=10, ma_windows=(200, 100, 50, 60), return_windows=(50, 60, 100), columns=None):
+        """
+        Parameters
+        ----------
+
+        rsi_window : int
+            window of the RSI
+
+        ma_windows : tuple of int
+            windows of the simple and exponential moving averages
+
+        return_windows : tuple of int
+            windows of the cumulative returns
+
+        columns : list of str
+            only these indicator columns, in this order, instead of the ones of the windows, see for_features
+        """
+        self.rsi_window = rsi_window
+        self.ma_windows = tuple(ma_windows)
+        self.return_windows = tuple(return_windows)
+        self.selected = None if columns is None else list(columns)
+
+    @classmethod
+    def for_features(cls, features, rsi_window=10, minutes=None):
+        """
+        Spec with only the indicators that features need, e.g., the features of a strategy, see resolve_indicators
+        """
+        return cls(rsi_window=rsi_window, columns=resolve_indicators(features, minutes=minutes))
+
+    @property
+    def columns(self):
+        if self.selected is not None:
+            return list(self.selected)
+        columns = ["RSI"]
+        for window in self.ma_windows:
+            columns += [f"SMA{window}", f"EMA{window}"]
+        return columns + ["pct change"] + [f"CUM_RETURNS_{window}" for window in self.return_windows]
+
+
+def cumulative_returns(close, windows):
+    """
+    Cumulative returns over several windows in one vectorized pass. The product of (pct change + 1) over a window
+    is the exponent of the summed log returns, i.e., the difference of the cumulative log return at the window
+    offset, which telescopes to close[t] / close[t - window]. The ratio is used directly: it needs no log/exp and a
+    missing price only affects the windows that start or end at it.
+
+    Parameters
+    ----------
+
+    close : array-like
+        close prices
+
+    windows : iterable of int
+        windows of the cumulative returns
+
+    Returns
+    -------
+    (np.ndarray, dict)
+        the pct change + 1 and a dict with the cumulative returns per window
+    """
+    close = np.asarray(close, dtype=float)
+    n = len(close)
+    pct_change = np.full(n, np.nan)
+    pct_change[1:] = close[1:] / close[:-1]
+
+    returns = {}
+    for window in windows:
+        values = np.full(n, np.nan)
+        if window < n:
+            values[window:] = close[window:] / close[:-window]
+        returns[window] = values
+    return pct_change, returns
+
+
+RAW_COLUMNS = ("Low", "High", "Open", "Close", "Volume")
+
+# every kind of indicator: the columns it is computed from and the batch function of their values, the window of
+# the column and the spec. An indicator can depend on other indicators, they are computed first
+INDICATORS = {
+    "RSI": (("Close",), lambda close, window, spec: rsi(pd.Series(close), window=spec.rsi_window).to_numpy()),
+    "SMA": (("Close",), lambda close, window, spec: sma_indicator(pd.Series(close), window=window).to_numpy()),
+    "EMA": (("Close",), lambda close, window, spec: ema_indicator(pd.Series(close), window=window).to_numpy()),
+    "pct change": (("Close",), lambda close, window, spec: cumulative_returns(close, ())[0]),
+    "CUM_RETURNS": (("Close",), lambda close, window, spec: cumulative_returns(close, (window,))[1][window]),
+}
+
+
+def parse_indicator(name):
+    """
+    Kind and window of an indicator column, e.g., ("SMA", 50) for "SMA50" and ("RSI", None) for "RSI"
+    """
+    if name in ("RSI", "pct change"):
+        return name, None
+    for prefix in ("SMA", "EMA", "CUM_RETURNS_"):
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            return prefix.rstrip("_"), int(name[len(prefix):])
+    raise KeyError(f"unknown indicator: {name}")
+
+
+def resolve_indicators(features, minutes=None):
+    """
+    The indicator columns that have to be computed for features, every column after the ones it depends on. The
+    candle columns and columns that are not indicators, e.g., last_buying_price, are skipped
+
+    Parameters
+    ----------
+
+    features : iterable of str
+        columns that are used, e.g., ["RSI", "EMA50", "RSI_60m"]
+
+    minutes : int
+        the timeframe to resolve the columns of, e.g., 60 for RSI_60m, the 1-minute columns if None
+
+    Returns
+    -------
+    list of str
+        the indicator columns
+    """
+    columns = []
+
+    def visit(name):
+        if name in RAW_COLUMNS or name in columns:
+            return
+        try:
+            kind, _ = parse_indicator(name)
+        except KeyError:
+            return
+        for dependency in INDICATORS[kind][0]:
+            visit(dependency)
+        columns.append(name)
+
+    for feature in features:
+        match = re.fullmatch(r"(.+)_(\d+)m", feature)  # a column of a higher timeframe
+        if match is None and minutes is None:
+            visit(feature)
+        elif match is not None and int(match.group(2)) == minutes:
+            visit(match.group(1))
+    return columns
+
+
+class IndicatorGraph(object):
+    """
+    Lazy indicator columns over the candle columns of one version of the data. A column is computed the first time
+    it is requested, after the columns it depends on, and is kept, so every indicator is computed at most once no
+    matter how many columns or strategies need it.
+    """
+
+    def __init__(self, source, spec=None, dtype=None):
+        """
+        Parameters
+        ----------
+
+        source : callable
+            returns the values of a stored column by name, e.g., "Close", or None if the column is not stored
+
+        spec : IndicatorSpec
+            spec with the RSI window, the default spec if None
+
+        dtype : np.dtype
+            dtype the computed columns are kept in, float64 if None
+        """
+        self.source = source
+        self.spec = IndicatorSpec() if spec is None else spec
+        self.dtype = dtype
+        self.cache = {}
+
+    def __getitem__(self, name):
+        if name in self.cache:
+            return self.cache[name]
+        values = self.source(name)
+        if values is not None:
+            return values
+
+        kind, window = parse_indicator(name)
+        dependencies, function = INDICATORS[kind]
+        inputs = [np.asarray(self[dependency], dtype=float) for dependency in dependencies]
+        values = function(*inputs, window, self.spec)
+        self.cache[name] = values if self.dtype is None else values.astype(self.dtype, copy=False)
+        return self.cache[name]
+
+
+def compute_indicators(df, spec=None):
+    """
+    Compute the indicator columns of spec over the whole dataframe in batch
+
+    Parameters
+    ----------
+
+    df : pd.DataFrame
+        candles with at least a Close column, the columns are added in place
+
+    spec : IndicatorSpec
+        the indicators to compute, the default spec if None
+
+    Returns
+    -------
+    pd.DataFrame
+        the candles with the indicator columns
+    """
+    spec = IndicatorSpec() if spec is None else spec
+    graph = IndicatorGraph(lambda name: df[name].to_numpy() if name in df.columns else None, spec)
+    for column in spec.columns:
+        df[column] = graph[column]
+    return df
+
+
+class StreamingSMA(object):
+    """
+    Simple moving average updated in O(1) per value with a running sum over a ring buffer,
+    same values as ta.trend.sma_indicator
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.n_updates = 0
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(x)
+        self.total += x
+
+        # recompute the sum once per window so rounding errors of the running sum cannot accumulate
+        self.n_updates += 1
+        if self.n_updates % self.window == 0:
+            self.total = math.fsum(self.values)
+
+        if len(self.values) < self.window:
+            return np.nan
+        return self.total / self.window
+
+
+class StreamingEMA(object):
+    """
+    Exponential moving average updated in O(1) per value, same values as ta.trend.ema_indicator
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.alpha = 2 / (window + 1)
+        self.value = None
+        self.count = 0
+
+    def update(self, x):
+        self.value = x if self.value is None else self.value + self.alpha * (x - self.value)
+        self.count += 1
+        if self.count < self.window:
+            return np.nan
+        return self.value
+
+
+class StreamingRSI(object):
+    """
+    Wilder's RSI updated in O(1) per value, same values as ta.momentum.rsi
+    """
+
+    def __init__(self, window=10):
+        self.window = window
+        self.alpha = 1 / window
+        self.prev_close = None
+        self.up = 0.0
+        self.down = 0.0
+        self.count = 0
+
+    def update(self, x):
+        if self.prev_close is not None:
+            diff = x - self.prev_close
+            self.up += self.alpha * (max(diff, 0.0) - self.up)
+            self.down += self.alpha * (max(-diff, 0.0) - self.down)
+        self.prev_close = x
+        self.count += 1
+
+        if self.count < self.window:
+            return np.nan
+        if self.down == 0:
+            return 100.0
+        return 100 - 100 / (1 + self.up / self.down)
+
+
+class StreamingReturns(object):
+    """
+    Percentage change and cumulative returns over several windows updated in O(1) per value. The cumulative return
+    over a window is the product of the price ratios in it, which equals close[t] / close[t - window].
+    """
+
+    def __init__(self, windows=(50, 60, 100)):
+        self.windows = tuple(windows)
+        self.closes = deque(maxlen=max(self.windows, default=0) + 1)
+
+    def update(self, x):
+        prev_close = self.closes[-1] if len(self.closes) > 0 else np.nan
+        self.closes.append(x)
+        n = len(self.closes)
+        values = [x / prev_close]
+        for window in self.windows:
+            values.append(x / self.closes[-1 - window] if n > window else np.nan)
+        return values
+
+
+class IndicatorEngine(object):
+    """
+    Stateful engine which keeps the indicator columns of CoinbaseAPI up to date in constant time per new candle
+    """
+
+    def __init__(self, spec=None):
+        """
+        Parameters
+        ----------
+
+        spec : IndicatorSpec
+            the indicators to keep up to date, the default spec if None
+        """
+        self.spec = IndicatorSpec() if spec is None else spec
+        self.columns = self.spec.columns
+        kinds = [parse_indicator(column) for column in self.columns]
+
+        # only the streaming indicators of the columns, the pct change and cumulative returns share one
+        self.indicators = []
+        self.outputs = []  # per column: the position of its indicator and of its value in a list of values
+        return_windows = [window for kind, window in kinds if kind == "CUM_RETURNS"]
+        returns = None
+        for kind, window in kinds:
+            if kind in ("pct change", "CUM_RETURNS"):
+                if returns is None:
+                    returns = len(self.indicators)
+                    self.indicators.append(StreamingReturns(return_windows))
+                item = 0 if kind == "pct change" else 1 + return_windows.index(window)
+                self.outputs.append((returns, item))
+                continue
+            if kind == "RSI":
+                self.indicators.append(StreamingRSI(self.spec.rsi_window))
+            else:
+                self.indicators.append(StreamingSMA(window) if kind == "SMA" else StreamingEMA(window))
+            self.outputs.append((len(self.indicators) - 1, None))
+
+    def update(self, close):
+        """
+        Feed one close price to the engine
+
+        Returns
+        -------
+        list
+            the indicator values for this close in the order of self.columns
+        """
+        close = float(close)
+        values = [indicator.update(close) for indicator in self.indicators]
+        return [values[i] if item is None else values[i][item] for i, item in self.outputs]
+
+    def seed(self, closes):
+        """
+        Bring the engine up to date with the close prices it has not seen yet, e.g., the history loaded in batch
+        """
+        for close in closes:
+            self.update(close)
+
+    def transform(self, df):
+        """
+        Add the indicator columns to new candles that follow the ones the engine has already seen
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame
+            new candles with at least a Close column
+
+        Returns
+        -------
+        pd.DataFrame
+            the candles with the indicator columns
+        """
+        values = [self.update(close) for close in df.Close]
+        df = df.copy()
+        df[self.columns] = pd.DataFrame(values, index=df.index, columns=self.columns, dtype=float)
+        return df
@@ -0,0 +1,332 @@
+import asyncio
+
+import pandas as pd
+
+from Clock import Clock
+from Metrics import metrics
+from Utils import convert_time_to_str
+
+
+class LiveEngine(object):
+    """
+    Event-driven version of CoinbaseBot.run. Candle arrival, strategy evaluation, order status checks and order
+    cancellation are separate asyncio tasks, so the strategy is evaluated as soon as a minute has closed and fills and
+    cancels are noticed within the poll interval instead of once per minute. The REST calls of the bot run in threads,
+    so a slow request does not block the other tasks.
+    """
+
+    def __init__(self, bot, strategy, window=200, cancel_time=30, poll_interval=5, clock=None, allocator=None,
+                 feed=None, verbose=1):
+        """
+        Parameters
+        ----------
+
+        bot : CoinbaseBot
+            bot with the client, the product and the capital, used to fetch the candles and place the orders
+
+        strategy : Strategy
+            Object that inherits from Strategy which is able to return 'BUY', 'SELL', 'NO TRADE' with the 'action'
+            method
+
+        window : int
+            number of most recent candles that are given to the strategy
+
+        cancel_time : float
+            time we can wait before we cancel a buy/sell order in minutes
+
+        poll_interval : float
+            seconds between two checks of the status of an open order, and between two candle requests when the
+            exchange has not published the last minute yet
+
+        clock : Clock
+            clock used for the time and the waiting, the wall clock if None
+
+        allocator : callable
+            called with the engine before a buy order and returns the capital to buy with, the capital of the bot
+            is used and replaced by the balance after every sell if None
+
+        feed : WebSocketFeed
+            streaming feed that delivers the candles as soon as they close, the candles are polled from the REST
+            API if None
+        """
+        self.bot = bot
+        self.api = bot.api
+        self.strategy = strategy
+        self.window = window
+        self.cancel_time = cancel_time
+        self.poll_interval = poll_interval
+        self.clock = Clock() if clock is None else clock
+        self.allocator = allocator
+        self.feed = feed
+        self.verbose = verbose
+
+        self.entried = False
+        self.last_buying_price = -1
+        self.order = None  # the open order
+        self.buy_order = None  # the filled buy order of the current position
+        self.trades = []
+        # the queue of new candles and the event of a new order are created by create_tasks, in the running loop
+        self.bars = None
+        self.order_placed = None
+        self.cancel_timer = None
+
+    def log(self, message):
+        if self.verbose:
+            print("Time: %s, %s" % (convert_time_to_str(self.clock.time()), message))
+
+    def record_order(self, order, event):
+        if self.bot.journal is not None:
+            self.bot.journal.record_order(order, event, product_id=self.bot.product_id, time=self.clock.time())
+
+    async def call(self, function, *args, **kwargs):
+        """
+        Run a blocking REST call in a thread
+        """
+        return await asyncio.to_thread(function, *args, **kwargs)
+
+    async def candle_task(self):
+        """
+        Fetch the candle of every minute as soon as it has closed and announce it to the strategy task
+        """
+        while True:
+            now = self.clock.time()
+            await self.clock.wait(60 - now % 60)
+            next_minute = self.clock.time() + 60
+            # the exchange may publish the candle a bit later, retry until the next minute starts
+            while self.clock.time() < next_minute - self.poll_interval:
+                try:
+                    if await self.call(self.api.update_candles, closed_only=True) > 0:
+                        self.bars.put_nowait(self.api.candles.last_time)
+                        break
+                except Exception as e:
+                    self.log("An error had occured while updating the candles: %s" % e)
+                await self.clock.wait(self.poll_interval)
+
+    async def strategy_task(self):
+        """
+        Evaluate the strategy on every new candle and place an order when it gives a signal
+        """
+        while True:
+            await self.bars.get()
+            while not self.bars.empty():  # only the latest candle matters when we fell behind
+                self.bars.get_nowait()
+
+            try:
+                df = self.api.to_frame(self.window)
+                df["last_buying_price"] = self.last_buying_price
+                with metrics.timer("strategy_action", symbol=self.bot.product_id):
+                    action = self.strategy.action(df, entried=self.entried)
+                self.log("Entried: %s, Action: %s" % (self.entried, action))
+                if self.order is not None:
+                    continue
+
+                last_row = df.iloc[-1, :]
+                if not self.entried and action == "BUY":
+                    if self.allocator is not None:
+                        self.bot.capital = self.allocator(self)
+                    order = await self.call(self.bot.place_buy_order, last_row, verbose=self.verbose)
+                elif self.entried and action == "SELL":
+                    size = round(float(self.buy_order['filled_size']), 6)
+                    order = await self.call(self.bot.place_sell_order, last_row, size=size, verbose=self.verbose)
+                else:
+                    continue
+            except Exception as e:
+                self.log("An error had occured: %s" % e)
+                continue
+
+            self.record_order(order, "placed" if "id" in order else "rejected")
+            if "id" not in order:  # e.g., insufficient funds
+                self.log("Order was rejected: %s" % order.get("message"))
+                continue
+            self.order = order
+            self.cancel_timer = asyncio.create_task(self.cancel_task(order['id']))
+            self.order_placed.set()
+
+    async def order_task(self):
+        """
+        Poll the status of the open order until it is done
+        """
+        while True:
+            if self.order is None:
+                self.order_placed.clear()
+                await self.order_placed.wait()
+            await self.clock.wait(self.poll_interval)
+            if self.order is None:
+                continue
+
+            try:
+                metrics.increment("api_calls", endpoint="get_order")
+                with metrics.timer("poll_order"):
+                    order = await self.call(self.bot.client.get_order, self.order['id'])
+            except Exception as e:
+                self.log("An error had occured while checking the order: %s" % e)
+                continue
+            if self.order is not None and order.get('status') == 'done':
+                await self.order_done(order)
+
+    async def cancel_task(self, order_id):
+        """
+        Cancel an order when it is not filled within the cancel time
+        """
+        await self.clock.wait(self.cancel_time * 60)
+        if self.order is None or self.order['id'] != order_id:
+            return
+
+        metrics.increment("api_calls", endpoint="cancel_order")
+        result = await self.call(self.bot.client.cancel_order, order_id)
+        if result == order_id:
+            metrics.increment("cancels", side=self.order['side'])
+            self.record_order(self.order, "canceled")
+            self.log("Canceled %s order with the following details:\n%s" % (self.order['side'].upper(), self.order))
+        # the order may be (partially) filled in the meantime, the filled part is kept
+        order = await self.call(self.bot.client.get_order, order_id)
+        if order.get('status') == 'done' and float(order['filled_size']) > 0:
+            await self.order_done(order)
+        else:
+            self.order = None
+
+    async def order_done(self, order):
+        """
+        Update the position after an order is filled
+        """
+        self.order = None
+        if self.cancel_timer is not None and self.cancel_timer is not asyncio.current_task():
+            self.cancel_timer.cancel()
+        metrics.increment("fills", side=order['side'])
+        self.record_order(order, "done")
+
+        if order['side'] == 'buy':  # we bought
+            self.entried = True
+            self.last_buying_price = float(order['price'])
+            self.buy_order = order
+        else:  # we sold
+            self.record_trade(self.buy_order, order)
+            left = float(self.buy_order['filled_size']) - float(order['filled_size'])
+            if left > 1e-8:  # a partially filled sell order leaves part of the position
+                self.buy_order = {**self.buy_order, 'filled_size': f"{left:.8f}"}
+            else:
+                self.entried = False
+                self.last_buying_price = -1
+                self.buy_order = None
+            if self.allocator is None:
+                self.bot.capital = float(await self.call(self.bot.get_balance, self.bot.product_id.split("-")[1]))
+        self.log("Filled %s order with the following details:\n%s" % (order['side'].upper(), order))
+
+    def record_trade(self, buy, sell):
+        """
+        Record the part of the position that was sold
+        """
+        buy_price = float(buy['price'])
+        sell_size, sell_price = float(sell['filled_size']), float(sell['price'])
+        buy_size = sell_size
+        self.trades.append({"Buy date": buy['created_at'],
+                            "Buy price": buy_price,
+                            "Buy size": buy_size,
+                            "Buy ID": buy['id'],
+                            "Sell date": sell['created_at'],
+                            "Sell price": sell_price,
+                            "Sell size": sell_size,
+                            "Sell ID": sell['id'],
+                            "Start capital": buy_size * buy_price,
+                            "End capital": sell_size * sell_price,
+                            "Return": (sell_price - buy_price) / buy_price,
+                            "Profit": sell_size * sell_price - buy_size * buy_price,
+                            "Product ID": self.bot.product_id})
+        if self.bot.journal is not None:
+            self.bot.journal.record_trade(self.trades[-1], time=self.clock.time())
+
+    async def close(self):
+        """
+        Cancel the open order, an open sell order is replaced by a market order so we end without a position
+        """
+        if self.order is None:
+            return
+        if self.cancel_timer is not None:
+            self.cancel_timer.cancel()
+        side = self.order['side']
+        await self.call(self.bot.client.cancel_order, self.order['id'])
+        self.record_order(self.order, "canceled")
+        order = await self.call(self.bot.client.get_order, self.order['id'])
+        if order.get('status') == 'done' and float(order['filled_size']) > 0:
+            await self.order_done(order)
+        self.order = None
+
+        if side == 'sell' and self.entried:
+            size = self.buy_order['filled_size']
+            order = await self.call(self.bot.client.place_market_order, self.bot.product_id, side="sell", size=size)
+            self.record_order(order, "placed" if "id" in order else "rejected")
+            if order.get('status') == 'done':
+                await self.order_done(order)
+
+    def create_tasks(self, candles=True):
+        """
+        Start the tasks of the engine, without the candle task when the candles are delivered by someone else,
+        e.g., a Portfolio that refreshes the candles of all its symbols at once
+        """
+        self.bars = asyncio.Queue()
+        self.order_placed = asyncio.Event()
+        tasks = [self.strategy_task, self.order_task]
+        if candles and self.feed is not None:
+            self.feed.add(self.api, self.bars)
+            tasks.append(self.feed.run)
+        elif candles:
+            tasks.append(self.candle_task)
+        return [asyncio.create_task(task()) for task in tasks]
+
+    async def run(self, running_time=60 * 2, lookback=60 * 2, entried=False):
+        """
+        Run the trading bot
+
+        Parameters
+        ----------
+
+        running_time: float
+            amount of time you want to run the trading bot given in minutes
+
+        lookback : int
+            The number of minutes to lookback starting from the current timestamp
+
+        entried: boolean
+            whether we are already entried or not
+
+        Returns
+        -------
+
+        df_trades: DataFrame
+            a DataFrame containing the trades that have taken place in the running time
+        """
+        if len(self.api.candles) == 0:  # only the indicators the strategy reads
+            self.api.require(self.strategy.features)
+        await self.call(self.api.get_minute_data, interval_min=1, lookback=lookback, closed_only=True)
+        self.entried = entried
+
+        tasks = self.create_tasks()
+        try:
+            await self.clock.wait(running_time * 60)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.close()
+            if self.bot.journal is not None:
+                self.bot.journal.sync()
+
+        self.log("Reached end of the allowed running time")
+        return pd.DataFrame(self.trades)
+
+
+if __name__ == "__main__":
+    from Clock import AcceleratedClock
+    from CoinbaseBot import CoinbaseBot
+    from Fetcher import HistoricRatesFetcher, TokenBucket
+    from SimulatedExchange import SimulatedExchange
+    from Strategy_RSI_SMA_RETURN import Strategy_RSI_SMA_RETURN
+
+    # run the engine end to end against the simulated exchange, one minute takes a second
+    clock = AcceleratedClock(start=1_640_995_200, speed=60)
+    exchange = SimulatedExchange(balances={"EUR": 1000.0}, clock=clock)
+    # the rate limit is in exchange time as well
+    fetcher = HistoricRatesFetcher(exchange, rate_limiter=TokenBucket(clock=clock))
+    bot = CoinbaseBot(client=exchange, product_id='BTC-EUR', capital=100, fetcher=fetcher)
+    engine = LiveEngine(bot, Strategy_RSI_SMA_RETURN(), clock=clock)
+    print(asyncio.run(engine.run(running_time=10, lookback=24 * 60)))
@@ -0,0 +1,480 @@
+import copy
+
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+from Indicators import IndicatorGraph, IndicatorSpec
+
+
+class CandleBuffer(object):
+    """
+    Growable columnar buffer of candles. The columns are preallocated and doubled in size when full, so appending a
+    candle is amortized O(1) and never copies the history into a new DataFrame.
+    """
+
+    def __init__(self, columns, capacity=1024, dtype=np.float64):
+        """
+        Parameters
+        ----------
+
+        columns : list of str
+            names of the value columns, e.g., ["Low", "High", "Open", "Close", "Volume", "RSI", ...]
+
+        capacity : int
+            number of candles to preallocate
+
+        dtype : np.dtype
+            dtype of the values, e.g., np.float32 to halve the memory
+        """
+        self.columns = list(columns)
+        self.positions = {column: i for i, column in enumerate(self.columns)}
+        self.dtype = np.dtype(dtype)
+        self.times = np.empty(capacity, dtype=np.int64)  # epoch seconds in UTC
+        self.values = np.empty((len(self.columns), capacity), dtype=self.dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.times)
+
+    @property
+    def last_time(self):
+        return int(self.times[self.size - 1]) if self.size > 0 else None
+
+    def reserve(self, capacity):
+        """
+        Make sure the buffer can hold capacity candles without growing
+        """
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        times = np.empty(capacity, dtype=np.int64)
+        values = np.empty((len(self.columns), capacity), dtype=self.dtype)
+        times[:self.size] = self.times[:self.size]
+        values[:, :self.size] = self.values[:, :self.size]
+        self.times, self.values = times, values
+
+    def append(self, times, values):
+        """
+        Append candles after the last one, candles that are not newer than the last candle are dropped
+
+        Parameters
+        ----------
+
+        times : np.ndarray
+            epoch seconds of the candles, sorted
+
+        values : np.ndarray
+            (n, len(columns)) array with the values of the candles
+
+        Returns
+        -------
+        int
+            number of candles that were appended
+        """
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=float).reshape(len(times), len(self.columns))
+        if self.size > 0:
+            new = times > self.last_time
+            times, values = times[new], values[new]
+
+        n = len(times)
+        self.reserve(self.size + n)
+        self.times[self.size:self.size + n] = times
+        self.values[:, self.size:self.size + n] = values.T
+        self.size += n
+        return n
+
+    def column(self, name):
+        """
+        View on the filled part of a column, no copy is made
+        """
+        return self.values[self.positions[name], :self.size]
+
+    def view(self, start=0, time_shift=timedelta(hours=1)):
+        """
+        CandleFrame on the candles from position start on without copying them, the candles appended later are not
+        part of it
+
+        Parameters
+        ----------
+
+        start : int
+            position of the first candle, negative to count from the end
+        """
+        start = max(0, self.size + start) if start < 0 else start
+        return CandleFrame(self.times[start:self.size], self.values[:, start:self.size], self.columns,
+                           time_shift=time_shift)
+
+    def to_frame(self, start=0, time_shift=timedelta(hours=1)):
+        """
+        DataFrame with the candles from position start on, indexed on the shifted time
+
+        Parameters
+        ----------
+
+        start : int
+            position of the first candle, negative to count from the end
+
+        time_shift : timedelta
+            shift of the index with respect to UTC, by default the time in the netherlands
+        """
+        start = max(0, self.size + start) if start < 0 else start
+        index = (pd.to_datetime(self.times[start:self.size], unit="s") + time_shift).rename("Time")
+        return pd.DataFrame(self.values[:, start:self.size].T, index=index, columns=self.columns)
+
+
+class RollingCandleBuffer(object):
+    """
+    Fixed-capacity ring buffer of candles with the same interface as CandleBuffer, for the live bot where only the
+    most recent candles are needed. Every candle is written twice, at its slot and at its slot + capacity, so the
+    last capacity candles are always one contiguous block and every window is a view without copying.
+    """
+
+    __slots__ = ("columns", "positions", "dtype", "capacity", "times", "values", "size", "head")
+
+    def __init__(self, columns, capacity=24 * 60, dtype=np.float64):
+        """
+        Parameters
+        ----------
+
+        columns : list of str
+            names of the value columns
+
+        capacity : int
+            number of candles that are kept, older candles are dropped
+
+        dtype : np.dtype
+            dtype of the values
+        """
+        self.columns = list(columns)
+        self.positions = {column: i for i, column in enumerate(self.columns)}
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.times = np.empty(2 * capacity, dtype=np.int64)
+        self.values = np.empty((len(self.columns), 2 * capacity), dtype=self.dtype)
+        self.size = 0
+        self.head = capacity  # the candles are in [head - size, head)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def last_time(self):
+        return int(self.times[self.head - 1]) if self.size > 0 else None
+
+    def append(self, times, values):
+        """
+        Append candles after the last one, candles that are not newer than the last candle are dropped
+
+        Parameters
+        ----------
+
+        times : np.ndarray
+            epoch seconds of the candles, sorted
+
+        values : np.ndarray
+            (n, len(columns)) array with the values of the candles
+
+        Returns
+        -------
+        int
+            number of candles that were appended
+        """
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=float).reshape(len(times), len(self.columns))
+        if self.size > 0:
+            new = times > self.last_time
+            times, values = times[new], values[new]
+        n = len(times)
+        kept_times, kept_values = times[-self.capacity:], values[-self.capacity:]
+
+        # slots of the new candles in the first half, every candle is also written to the second half
+        slots = (self.head + n - len(kept_times) + np.arange(len(kept_times))) % self.capacity
+        for offset in (0, self.capacity):
+            self.times[slots + offset] = kept_times
+            self.values[:, slots + offset] = kept_values.T
+
+        self.head = (self.head + n - 1) % self.capacity + 1 + self.capacity if n > 0 else self.head
+        self.size = min(self.capacity, self.size + n)
+        return n
+
+    def column(self, name):
+        """
+        View on a column with the candles that are kept, no copy is made
+        """
+        return self.values[self.positions[name], self.head - self.size:self.head]
+
+    def view(self, start=0, time_shift=timedelta(hours=1)):
+        """
+        CandleFrame on the kept candles from position start on without copying them. The slots are reused, so the
+        view is only valid until the next append; use to_frame for a copy that is kept longer
+
+        Parameters
+        ----------
+
+        start : int
+            position of the first candle among the kept ones, negative to count from the end
+        """
+        start = max(0, self.size + start) if start < 0 else min(start, self.size)
+        first = self.head - self.size + start
+        return CandleFrame(self.times[first:self.head], self.values[:, first:self.head], self.columns,
+                           time_shift=time_shift)
+
+    def last_row(self, time_shift=timedelta(hours=1)):
+        """
+        The last candle as a Series, like df.iloc[-1, :]
+        """
+        name = pd.to_datetime(self.times[self.head - 1], unit="s") + time_shift
+        return pd.Series(self.values[:, self.head - 1], index=self.columns, name=name)
+
+    def to_frame(self, start=0, time_shift=timedelta(hours=1)):
+        """
+        DataFrame with the candles from position start on, indexed on the shifted time
+
+        Parameters
+        ----------
+
+        start : int
+            position of the first candle among the kept ones, negative to count from the end
+
+        time_shift : timedelta
+            shift of the index with respect to UTC, by default the time in the netherlands
+        """
+        start = max(0, self.size + start) if start < 0 else min(start, self.size)
+        first = self.head - self.size + start
+        index = (pd.to_datetime(self.times[first:self.head], unit="s") + time_shift).rename("Time")
+        return pd.DataFrame(self.values[:, first:self.head].T, index=index, columns=self.columns)
+
+
+class CandleResampler(object):
+    """
+    Aggregates candles into candles of a higher timeframe, e.g., 1-minute candles into hourly ones. The candles of
+    a timeframe start at multiples of its granularity since the epoch, like the candles of the Coinbase API. A
+    candle is closed once the last base candle of its interval has been added, or when a base candle of a later
+    interval arrives, so every base candle takes O(1) work.
+    """
+
+    def __init__(self, granularity, base_granularity=60):
+        """
+        Parameters
+        ----------
+
+        granularity : int
+            seconds per candle of the higher timeframe
+
+        base_granularity : int
+            seconds per base candle
+        """
+        self.granularity = granularity
+        self.base_granularity = base_granularity
+        self.forming = None  # row of the candle that is not closed yet
+
+    def update(self, candles):
+        """
+        Add base candles that follow the ones added before
+
+        Parameters
+        ----------
+
+        candles : np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+
+        Returns
+        -------
+        np.ndarray
+            (m, 6) array with the candles of the higher timeframe that were closed by the new candles
+        """
+        candles = np.asarray(candles, dtype=float).reshape(-1, 6)
+        if len(candles) == 0:
+            return np.empty((0, 6))
+        if self.forming is not None:
+            candles = np.vstack([self.forming, candles])
+        starts = candles[:, 0] // self.granularity * self.granularity
+
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        last = np.r_[first[1:] - 1, len(candles) - 1]
+        resampled = np.column_stack([starts[first],
+                                     np.minimum.reduceat(candles[:, 1], first),
+                                     np.maximum.reduceat(candles[:, 2], first),
+                                     candles[first, 3],
+                                     candles[last, 4],
+                                     np.add.reduceat(candles[:, 5], first)])
+
+        # the last candle is still forming until the base candle at the end of its interval has been added
+        if candles[-1, 0] + self.base_granularity < resampled[-1, 0] + self.granularity:
+            self.forming = resampled[-1]
+            return resampled[:-1]
+        self.forming = None
+        return resampled
+
+
+class CandleFrame(object):
+    """
+    Compact columnar container of candles for long histories. The times are integer epoch seconds and the values
+    are stored in one (columns, n) block of a configurable dtype, e.g., float32 which halves the memory and still
+    keeps prices below 65536 to the cent. Indicator columns that are not stored are computed from the close prices
+    the first time they are used and cached, so a backtest only pays for the indicators its strategy reads. Slicing
+    returns a CandleFrame on the same arrays and cache without copying, and the columns are returned as Series on
+    the arrays, so strategies and the vectorized backtest can use a CandleFrame like a DataFrame.
+    """
+
+    raw_columns = ["Low", "High", "Open", "Close", "Volume"]
+
+    def __init__(self, times, values, columns=None, indicator_spec=None, time_shift=timedelta(hours=1)):
+        """
+        Parameters
+        ----------
+
+        times : np.ndarray
+            epoch seconds of the candles, sorted
+
+        values : np.ndarray
+            (len(columns), n) array with the stored columns, it is used without copying
+
+        columns : list of str
+            names of the stored columns, the raw columns if None
+
+        indicator_spec : IndicatorSpec
+            the indicator columns that are listed in columns next to the stored ones, the default spec if None
+
+        time_shift : timedelta
+            shift of the index with respect to UTC, by default the time in the netherlands
+        """
+        self._times = np.asarray(times, dtype=np.int64)
+        self._values = np.asarray(values)
+        self.positions = {column: i for i, column in enumerate(self.raw_columns if columns is None else columns)}
+        self.indicator_spec = IndicatorSpec() if indicator_spec is None else indicator_spec
+        self.time_shift = time_shift
+        # computed indicators over the whole arrays, shared with the slices
+        self.indicators = IndicatorGraph(self.stored, self.indicator_spec, dtype=self._values.dtype)
+        self.start, self.stop = 0, len(self._times)
+        self._index = None
+
+    @classmethod
+    def from_candles(cls, candles, dtype=np.float32, indicator_spec=None, time_shift=timedelta(hours=1)):
+        """
+        CandleFrame of raw candles, e.g., from CandleStore.read or HistoricRatesFetcher.fetch
+
+        Parameters
+        ----------
+
+        candles : np.ndarray
+            (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+
+        dtype : np.dtype
+            dtype of the values, np.float64 when prices need more than 7 significant digits
+        """
+        candles = np.asarray(candles).reshape(-1, 6)
+        values = np.ascontiguousarray(candles[:, 1:].T, dtype=dtype)
+        return cls(candles[:, 0], values, indicator_spec=indicator_spec, time_shift=time_shift)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def dtype(self):
+        return self._values.dtype
+
+    @property
+    def columns(self):
+        return list(self.positions) + [column for column in self.indicator_spec.columns
+                                       if column not in self.positions]
+
+    @property
+    def times(self):
+        return self._times[self.start:self.stop]
+
+    @property
+    def index(self):
+        """
+        Time of the candles in the shifted time zone, created on first use
+        """
+        if self._index is None:
+            self._index = (pd.to_datetime(self.times, unit="s") + self.time_shift).rename("Time")
+        return self._index
+
+    def stored(self, name):
+        """
+        All values of a stored column, also the ones outside the slice, None if the column is not stored
+        """
+        return self._values[self.positions[name]] if name in self.positions else None
+
+    def column(self, name):
+        """
+        View on a column, an indicator that is not stored is computed over all candles on first use, so a slice
+        has the same warm-up as the frame it was taken from
+        """
+        return self.indicators[name][self.start:self.stop]
+
+    @property
+    def materialized(self):
+        """
+        Names of the indicators that have been computed
+        """
+        return list(self.indicators.cache)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.slice(key.start, key.stop)
+        if isinstance(key, str):
+            return pd.Series(self.column(key), index=self.index, name=key, copy=False)
+        return self.to_frame(list(key))
+
+    def __getattr__(self, name):
+        # df.Close and df.RSI, like a DataFrame; only called when there is no attribute with that name
+        if name.startswith("_") or name not in self.columns:
+            raise AttributeError(name)
+        return self[name]
+
+    def slice(self, start=None, stop=None):
+        """
+        CandleFrame on the candles between the positions start and stop, sharing the arrays and the indicators
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        frame = copy.copy(self)
+        frame.start, frame.stop = self.start + start, self.start + max(start, stop)
+        frame._index = None
+        return frame
+
+    def between(self, start=None, end=None):
+        """
+        CandleFrame on the candles with start <= index <= end, like df.loc[start:end]
+
+        Parameters
+        ----------
+
+        start, end : pd.Timestamp
+            times in the shifted time zone of the index, open ended if None
+        """
+        def epoch(time):
+            return (pd.Timestamp(time) - self.time_shift).value // 10 ** 9
+
+        first = 0 if start is None else np.searchsorted(self.times, epoch(start), side="left")
+        last = len(self) if end is None else np.searchsorted(self.times, epoch(end), side="right")
+        return self.slice(first, last)
+
+    def to_frame(self, columns=None):
+        """
+        DataFrame with the columns, all columns if None. Stored columns that are next to each other are returned
+        without copying, otherwise only the requested columns are copied
+        """
+        columns = self.columns if columns is None else list(columns)
+        positions = [self.positions.get(column, -1) for column in columns]
+        if len(positions) > 0 and positions == list(range(positions[0], positions[0] + len(positions))) and \
+                positions[0] >= 0:
+            values = self._values[positions[0]:positions[-1] + 1, self.start:self.stop]
+        else:
+            values = np.vstack([self.column(column) for column in columns])
+        return pd.DataFrame(values.T, index=self.index, columns=columns, copy=False)
+
+    def memory_usage(self):
+        """
+        Bytes of the times, the stored values and the computed indicators
+        """
+        indicators = sum(values.nbytes for values in self.indicators.cache.values())
+        return self._times.nbytes + self._values.nbytes + indicators
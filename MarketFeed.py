@@ -0,0 +1,403 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from Clock import Clock
+from Metrics import metrics
+from Utils import convert_time_to_str
+
+WEBSOCKET_URL = "wss://ws-feed.exchange.coinbase.com"
+
+
+class CandleAggregator(object):
+    """
+    Builds the candles of one product from its trades. A candle is closed as soon as a trade of a later interval
+    arrives, or by close when its interval has ended without that trade. Like the historic rates of the REST API,
+    intervals without trades have no candle.
+    """
+
+    def __init__(self, granularity=60):
+        self.granularity = granularity
+        self.start = None  # start of the forming candle
+        self.low = self.high = self.open = self.close = np.nan
+        self.volume = 0.0
+        self.closed_until = None  # end of the last closed candle, trades before it are too late
+        self.trade_id = None  # id of the last trade, trade ids are consecutive per product
+        self.dirty_until = None  # candles up to this start may miss trades and are backfilled
+
+    def row(self):
+        return [self.start, self.low, self.high, self.open, self.close, self.volume]
+
+    def add(self, time, price, size):
+        """
+        Add a trade
+
+        Parameters
+        ----------
+
+        time : float
+            epoch seconds of the trade
+
+        price : float
+            price of the trade
+
+        size : float
+            size of the trade
+
+        Returns
+        -------
+        list
+            the rows [time, low, high, open, close, volume] of the candles that were closed by the trade
+        """
+        start = time // self.granularity * self.granularity
+        if (self.closed_until is not None and start < self.closed_until) or \
+                (self.start is not None and start < self.start):
+            metrics.increment("feed_late_trades")
+            return []
+
+        closed = []
+        if self.start is not None and start > self.start:
+            closed.append(self.row())
+            self.closed_until = self.start + self.granularity
+            self.start = None
+        if self.start is None:
+            self.start = start
+            self.low = self.high = self.open = price
+            self.volume = 0.0
+        self.low = min(self.low, price)
+        self.high = max(self.high, price)
+        self.close = price
+        self.volume += size
+        return closed
+
+    def close_until(self, now):
+        """
+        Close the forming candle when its interval has ended before now
+
+        Returns
+        -------
+        list
+            the row of the closed candle, empty if no candle was closed
+        """
+        if self.start is None or self.start + self.granularity > now:
+            return []
+        closed = [self.row()]
+        self.closed_until = self.start + self.granularity
+        self.start = None
+        return closed
+
+    def check_trade_id(self, trade_id, time):
+        """
+        Detect missed and duplicated trades from the trade id
+
+        Returns
+        -------
+        boolean
+            whether the trade is new
+        """
+        if trade_id is None:
+            return True
+        if self.trade_id is not None and trade_id <= self.trade_id:  # e.g., the last match after a reconnect
+            return False
+        if self.trade_id is None or trade_id > self.trade_id + 1:
+            # trades were missed, or we do not know what came before: the candles up to this one get backfilled
+            if self.trade_id is not None:
+                metrics.increment("feed_gaps")
+            self.mark_dirty(time)
+        self.trade_id = trade_id
+        return True
+
+    def mark_dirty(self, time):
+        """
+        Backfill the candles up to the one of time, e.g., when the connection was lost at time
+        """
+        start = time // self.granularity * self.granularity
+        self.dirty_until = start if self.dirty_until is None else max(self.dirty_until, start)
+
+
+async def connect_websocket(url):
+    import websockets  # only needed for the live feed
+
+    return await websockets.connect(url, max_size=None)
+
+
+class WebSocketFeed(object):
+    """
+    Streaming market data from the match (or ticker) channel of the Coinbase websocket feed. The trades are
+    aggregated into candles in memory, a candle is closed on its interval boundary and pushed straight into the
+    candles and indicators of the CoinbaseAPI and onto the queue of the strategy, so the strategy runs right after
+    the bar closes without a REST round trip. Candles that may miss trades, after connecting, after a gap in the
+    trade ids or after a disconnect, are backfilled with the REST historic rates.
+    """
+
+    def __init__(self, url=WEBSOCKET_URL, channel="matches", connect=None, granularity=60, grace=1.0,
+                 backfill=True, reconnect_delay=5, record_path=None, clock=None, verbose=1):
+        """
+        Parameters
+        ----------
+
+        url : str
+            url of the websocket feed
+
+        channel : str
+            "matches" or "ticker", the channel the trades are taken from
+
+        connect : callable
+            coroutine function that opens a connection to url, with async send and recv and close methods, e.g.,
+            ReplayWebSocket.connect to replay recorded messages. Uses the websockets package if None
+
+        granularity : int
+            seconds per candle
+
+        grace : float
+            seconds after the interval boundary to wait for trades that are still on their way before a candle is
+            closed in a quiet market
+
+        backfill : boolean
+            fetch the candles that may miss trades from the REST API
+
+        reconnect_delay : float
+            seconds to wait before reconnecting after the connection was lost
+
+        record_path : str
+            optional JSON lines file every received message is appended to, e.g., to replay it later
+
+        clock : Clock
+            clock used for the time and the waiting, the wall clock if None
+        """
+        self.url = url
+        self.channel = channel
+        self.connect = connect_websocket if connect is None else connect
+        self.granularity = granularity
+        self.grace = grace
+        self.backfill = backfill
+        self.reconnect_delay = reconnect_delay
+        self.record_path = record_path
+        self.clock = Clock() if clock is None else clock
+        self.verbose = verbose
+        self.subscribers = {}  # product id to the (CoinbaseAPI, asyncio.Queue) the candles go to
+        self.aggregators = {}
+        self.lock = None  # serializes the backfills, created by run inside the running loop
+
+    def log(self, message):
+        if self.verbose:
+            print("Time: %s, %s" % (convert_time_to_str(self.clock.time()), message))
+
+    def add(self, api, bars):
+        """
+        Feed the candles of the product of api to it, the time of every appended candle is put on bars
+        """
+        self.subscribers[api.symbol] = (api, bars)
+        self.aggregators[api.symbol] = CandleAggregator(self.granularity)
+
+    async def handle(self, message):
+        """
+        Aggregate a trade message and publish the candles it closes
+        """
+        kind = message.get("type")
+        aggregator = self.aggregators.get(message.get("product_id"))
+        if aggregator is None or kind not in ("match", "last_match", "ticker"):
+            return
+        time = datetime.fromisoformat(message["time"].replace("Z", "+00:00")).timestamp()
+        if not aggregator.check_trade_id(message.get("trade_id"), time) or kind == "last_match":
+            return  # the last match only tells where the trade ids continue, it may be long ago
+        size = message["size"] if kind == "match" else message["last_size"]
+        closed = aggregator.add(time, float(message["price"]), float(size))
+        if closed:
+            await self.publish(message["product_id"], closed)
+
+    async def publish(self, product_id, rows):
+        """
+        Append closed candles to the candles of the product, backfilled from the REST API when they may miss trades
+        """
+        api, bars = self.subscribers[product_id]
+        aggregator = self.aggregators[product_id]
+        candles = np.asarray(rows, dtype=float).reshape(-1, 6)
+        async with self.lock:
+            if aggregator.dirty_until is not None:
+                if self.backfill:
+                    start = candles[0, 0] if len(api.candles) == 0 else api.candles.last_time + self.granularity
+                    fetched = await asyncio.to_thread(self.fetch, api, start, candles[-1, 0])
+                    candles = np.concatenate([fetched, candles])
+                    _, first = np.unique(candles[:, 0], return_index=True)  # the fetched candles win
+                    candles = candles[first]
+                    metrics.increment("feed_backfills")
+                    # the range stays dirty until the exchange has published its candles, the next publish retries
+                    if len(fetched) > 0 and fetched[-1, 0] >= aggregator.dirty_until:
+                        aggregator.dirty_until = None
+                elif candles[-1, 0] >= aggregator.dirty_until:
+                    aggregator.dirty_until = None
+
+            if api.append_candles(candles) > 0:
+                last_time = api.candles.last_time
+                metrics.observe("bar_delay", self.clock.time() - last_time - self.granularity, symbol=product_id)
+                bars.put_nowait(last_time)
+
+    def fetch(self, api, start, end):
+        start, end = pd.to_datetime(start, unit="s"), pd.to_datetime(end, unit="s")
+        interval_min = self.granularity // 60
+        if api.store is not None:
+            return api.sync_candles(start, end, interval_min=interval_min)
+        return api.fetch_candles(start, end, interval_min=interval_min)
+
+    async def close_task(self):
+        """
+        Close the candles of the products without a trade since their interval has ended
+        """
+        while True:
+            now = self.clock.time()
+            await self.clock.wait(self.granularity - now % self.granularity + self.grace)
+            now = self.clock.time() - self.grace
+            for product_id, aggregator in self.aggregators.items():
+                closed = aggregator.close_until(now)
+                if closed:
+                    await self.publish(product_id, closed)
+
+    def record(self, message):
+        with open(self.record_path, "a") as f:
+            f.write(message + "\n")
+
+    async def run(self):
+        """
+        Receive the trades of all products until cancelled, reconnecting when the connection is lost
+        """
+        self.lock = asyncio.Lock()
+        closer = asyncio.create_task(self.close_task())
+        subscribe = {"type": "subscribe", "product_ids": list(self.subscribers), "channels": [self.channel]}
+        try:
+            while True:
+                connection = None
+                try:
+                    connection = await self.connect(self.url)
+                    await connection.send(json.dumps(subscribe))
+                    while True:
+                        message = await connection.recv()
+                        metrics.increment("feed_messages")
+                        if self.record_path is not None:
+                            self.record(message)
+                        await self.handle(json.loads(message))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    metrics.increment("feed_reconnects")
+                    self.log("The websocket feed was disconnected: %s" % e)
+                    for aggregator in self.aggregators.values():  # the candles closed until we are back may miss trades
+                        aggregator.mark_dirty(self.clock.time())
+                    await self.clock.wait(self.reconnect_delay)
+                finally:
+                    if connection is not None:
+                        await connection.close()
+        finally:
+            closer.cancel()
+            await asyncio.gather(closer, return_exceptions=True)
+
+
+class ReplayWebSocket(object):
+    """
+    Local stand-in for the websocket feed that replays recorded messages, e.g., a record_path file of
+    WebSocketFeed or matches_from_candles. Every trade is delivered when the clock reaches its time plus the
+    latency, the messages of products that are not subscribed are skipped.
+    """
+
+    def __init__(self, messages, clock=None, latency=0.0):
+        """
+        Parameters
+        ----------
+
+        messages : list of dict or str
+            the messages or the path of a JSON lines file with them, sorted on time
+
+        clock : Clock
+            clock the messages are replayed on, the wall clock if None
+
+        latency : float
+            seconds between the time of a trade and its delivery
+        """
+        if isinstance(messages, str):
+            with open(messages) as f:
+                messages = [json.loads(line) for line in f if line.strip()]
+        self.messages = messages
+        self.clock = Clock() if clock is None else clock
+        self.latency = latency
+        self.position = 0  # a reconnect continues where the previous connection stopped
+        self.product_ids = set()
+
+    async def connect(self, url):
+        return self
+
+    async def send(self, message):
+        message = json.loads(message)
+        if message.get("type") == "subscribe":
+            self.product_ids.update(message["product_ids"])
+
+    async def recv(self):
+        while self.position < len(self.messages):
+            message = self.messages[self.position]
+            self.position += 1
+            if "product_id" in message and message["product_id"] not in self.product_ids:
+                continue
+            if "time" in message:
+                time = datetime.fromisoformat(message["time"].replace("Z", "+00:00")).timestamp()
+                await self.clock.wait(time + self.latency - self.clock.time())
+            return json.dumps(message)
+        await asyncio.Event().wait()  # no more trades, like a quiet market
+
+    async def close(self):
+        pass
+
+
+def matches_from_candles(candles, product_id, first_trade_id=1):
+    """
+    Match messages with the trades of candles: the open, low, high and close of every candle, with the volume
+    divided over them. Aggregating the messages gives the candles back.
+
+    Parameters
+    ----------
+
+    candles : np.ndarray
+        (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time
+
+    product_id : str
+        product of the messages
+
+    first_trade_id : int
+        trade id of the first trade
+
+    Returns
+    -------
+    list of dict
+        the match messages
+    """
+    messages = []
+    trade_id = first_trade_id
+    for time, low, high, open_, close, volume in np.asarray(candles, dtype=float):
+        for offset, price in ((1, open_), (15, low), (30, high), (59, close)):
+            messages.append({"type": "match", "trade_id": trade_id, "product_id": product_id,
+                             "time": datetime.fromtimestamp(time + offset, tz=timezone.utc).strftime(
+                                 "%Y-%m-%dT%H:%M:%S.%fZ"),
+                             "price": repr(float(price)), "size": repr(float(volume) / 4), "side": "buy"})
+            trade_id += 1
+    return messages
+
+
+if __name__ == "__main__":
+    from Clock import AcceleratedClock
+    from CoinbaseBot import CoinbaseBot
+    from Fetcher import HistoricRatesFetcher, TokenBucket
+    from LiveEngine import LiveEngine
+    from SimulatedExchange import SimulatedExchange
+    from Strategy_RSI_SMA_RETURN import Strategy_RSI_SMA_RETURN
+
+    # run the engine on candles built from replayed trades, one minute takes a second
+    clock = AcceleratedClock(start=1_640_995_200, speed=60)
+    exchange = SimulatedExchange(balances={"EUR": 1000.0}, clock=clock)
+    candles = exchange.market_candles("BTC-EUR", clock.time() - 60, clock.time() + 10 * 60, 60)
+    feed = WebSocketFeed(connect=ReplayWebSocket(matches_from_candles(candles, "BTC-EUR"), clock=clock).connect,
+                         clock=clock)
+    fetcher = HistoricRatesFetcher(exchange, rate_limiter=TokenBucket(clock=clock))
+    bot = CoinbaseBot(client=exchange, product_id='BTC-EUR', capital=100, fetcher=fetcher)
+    engine = LiveEngine(bot, Strategy_RSI_SMA_RETURN(), clock=clock, feed=feed)
+    print(asyncio.run(engine.run(running_time=10, lookback=24 * 60)))
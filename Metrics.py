@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter, time
+
+import numpy as np
+
+
+class Timing(object):
+    """
+    Durations of one operation: the count and sum of all observations and a window of the most recent ones for the
+    quantiles
+    """
+
+    def __init__(self, max_samples=10000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        return float(np.quantile(self.samples, q)) if len(self.samples) > 0 else float("nan")
+
+    def stats(self):
+        return {"count": self.count, "sum": self.total, "mean": self.total / self.count if self.count else float("nan"),
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99), "max": self.max}
+
+
+class Metrics(object):
+    """
+    Registry of timings, counters and gauges of the bot, e.g., the time of the data fetch and strategy.action per
+    minute, the number of API calls and retries and the size of the frames. Every metric has a name and optional
+    labels, and the registry can be exported as Prometheus text or appended as JSON lines to a file.
+    """
+
+    quantiles = (0.5, 0.99)
+
+    def __init__(self, prefix="trading_bot", max_samples=10000):
+        """
+        Parameters
+        ----------
+
+        prefix : str
+            prefix of the metric names in the Prometheus export
+
+        max_samples : int
+            number of most recent durations per timing the quantiles are computed on
+        """
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self.enabled = True
+        self.timings = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record a duration in seconds
+        """
+        if not self.enabled:
+            return
+        key = self.key(name, labels)
+        with self.lock:
+            if key not in self.timings:
+                self.timings[key] = Timing(self.max_samples)
+            self.timings[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Record the duration of a block, e.g., with metrics.timer("strategy_action"): ...
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def increment(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Set a gauge, e.g., the number of rows of the frame given to the strategy
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def reset(self):
+        with self.lock:
+            self.timings, self.counters, self.gauges = {}, {}, {}
+
+    def snapshot(self):
+        """
+        All metrics as a JSON serializable dict
+        """
+        def name(key):
+            labels = ",".join(f"{label}={value}" for label, value in key[1])
+            return f"{key[0]}{{{labels}}}" if labels else key[0]
+
+        with self.lock:
+            return {"time": time(),
+                    "timings": {name(key): timing.stats() for key, timing in self.timings.items()},
+                    "counters": {name(key): value for key, value in self.counters.items()},
+                    "gauges": {name(key): value for key, value in self.gauges.items()}}
+
+    def summary(self):
+        """
+        Table with the timings in milliseconds, the largest total time first
+        """
+        import pandas as pd
+
+        timings = pd.DataFrame(self.snapshot()["timings"]).T
+        if len(timings) == 0:
+            return timings
+        timings[["sum", "mean", "p50", "p99", "max"]] *= 1000
+        return timings.sort_values("sum", ascending=False)
+
+    def to_prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format, the timings as summaries with the p50 and p99
+        """
+        def labels(pairs, **extra):
+            pairs = list(pairs) + list(extra.items())
+            return "{" + ",".join(f'{label}="{value}"' for label, value in pairs) + "}" if pairs else ""
+
+        lines = []
+        with self.lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                typed = set()
+                for (name, pairs), value in sorted(metrics.items()):
+                    name = f"{self.prefix}_{name}" + ("_total" if kind == "counter" else "")
+                    if name not in typed:
+                        lines.append(f"# TYPE {name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{name}{labels(pairs)} {value}")
+
+            typed = set()
+            for (name, pairs), timing in sorted(self.timings.items()):
+                name = f"{self.prefix}_{name}_seconds"
+                if name not in typed:
+                    lines.append(f"# TYPE {name} summary")
+                    typed.add(name)
+                for q in self.quantiles:
+                    lines.append(f"{name}{labels(pairs, quantile=q)} {timing.quantile(q)}")
+                lines.append(f"{name}_sum{labels(pairs)} {timing.total}")
+                lines.append(f"{name}_count{labels(pairs)} {timing.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Write the Prometheus text to a file, e.g., for the textfile collector of the node exporter
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def dump_jsonl(self, path):
+        """
+        Append a snapshot of the metrics as one JSON line
+        """
+        with open(path, "a") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+
+metrics = Metrics()  # default registry of the bot, backtests and data pipeline
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+
+class ModelRegistry(object):
+    """
+    Versioned store of trained models. Every version is a directory root/name/v<version> with the saved Keras model
+    and a metadata.json with, e.g., the features, the training range and the metrics. TensorFlow is only imported
+    when a model is actually loaded, and models can be loaded and warmed up in a background thread.
+    """
+
+    def __init__(self, root='models', max_workers=2):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.loaded = {}  # (name, version) -> future of the loaded model
+        self.lock = threading.Lock()
+
+    def version_path(self, name, version):
+        return os.path.join(self.root, name, f"v{version}")
+
+    def versions(self, name):
+        """
+        Sorted list of the versions of a model
+        """
+        directory = os.path.join(self.root, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(entry[1:]) for entry in os.listdir(directory) if entry.startswith("v") and entry[1:].isdigit())
+
+    def metadata(self, name, version):
+        with open(os.path.join(self.version_path(name, version), "metadata.json")) as f:
+            return json.load(f)
+
+    def find(self, name, **criteria):
+        """
+        Latest version of which the metadata matches all criteria, e.g., find("LSTM", lookback=1)
+
+        Returns
+        -------
+        int or None
+            the version, None if there is no matching version
+        """
+        for version in reversed(self.versions(name)):
+            metadata = self.metadata(name, version)
+            if all(metadata.get(key) == value for key, value in criteria.items()):
+                return version
+        return None
+
+    def register(self, name, model, metadata):
+        """
+        Save a model as a new version
+
+        Parameters
+        ----------
+
+        name : str
+            name of the model, e.g., "LSTM"
+
+        model : keras.Model
+            the trained model
+
+        metadata : dict
+            JSON serializable information about the model, e.g., features, training range and metrics
+
+        Returns
+        -------
+        int
+            the new version
+        """
+        versions = self.versions(name)
+        version = versions[-1] + 1 if len(versions) > 0 else 1
+        path = self.version_path(name, version)
+        os.makedirs(path)
+        model.save(os.path.join(path, "model"))
+        with open(os.path.join(path, "metadata.json"), "w") as f:
+            json.dump({**metadata, "name": name, "version": version, "created": datetime.now().isoformat()}, f,
+                      indent=2, default=str)
+        future = Future()
+        future.set_result(model)
+        with self.lock:
+            self.loaded[(name, version)] = future
+        return version
+
+    def _load(self, name, version, warm_up=None):
+        from tensorflow import keras  # only import TensorFlow when a model is needed
+
+        model = keras.models.load_model(os.path.join(self.version_path(name, version), "model"))
+        if warm_up is not None:
+            warm_up(model)
+        return model
+
+    def preload(self, name, version, warm_up=None):
+        """
+        Start loading a model in the background, loading the same version again returns the same future
+
+        Parameters
+        ----------
+
+        warm_up : callable
+            called with the loaded model in the background, e.g., to run a first prediction
+
+        Returns
+        -------
+        concurrent.futures.Future
+            future of the loaded model
+        """
+        with self.lock:
+            if (name, version) not in self.loaded:
+                self.loaded[(name, version)] = self.executor.submit(self._load, name, version, warm_up)
+            return self.loaded[(name, version)]
+
+    def load(self, name, version):
+        """
+        Load a model, blocks until it is loaded
+        """
+        return self.preload(name, version).result()
@@ -0,0 +1,171 @@
+import itertools
+import os
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from Backtesting import backtest_trades, performance
+
+
+def parameter_grid(grid):
+    """
+    All combinations of a parameter grid
+
+    Parameters
+    ----------
+
+    grid : dict
+        parameter name to the list of values to try, e.g., {"RSI_buy": [30, 40], "RSI_sell": [60, 70, 80]}
+
+    Returns
+    -------
+    list of dict
+        the parameters of every combination
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def random_parameters(space, n_samples=100, seed=0):
+    """
+    Random samples from a parameter space
+
+    Parameters
+    ----------
+
+    space : dict
+        parameter name to either a (low, high) tuple to sample uniformly from or a list of values to choose from
+
+    n_samples : int
+        number of parameter combinations
+
+    seed : int
+        seed of the random generator
+
+    Returns
+    -------
+    list of dict
+        the sampled parameters
+    """
+    rng = np.random.default_rng(seed)
+    samples = [{} for _ in range(n_samples)]
+    for name, values in space.items():
+        if isinstance(values, tuple):
+            drawn = rng.uniform(values[0], values[1], n_samples)
+        else:
+            drawn = [values[i] for i in rng.integers(0, len(values), n_samples)]
+        for sample, value in zip(samples, drawn):
+            sample[name] = value
+    return samples
+
+
+class SharedFrame(object):
+    """
+    A float DataFrame of which the values and the index live in shared memory, so worker processes can use the
+    candles and indicators without receiving a copy
+    """
+
+    def __init__(self, df):
+        values = np.ascontiguousarray(df.to_numpy(dtype=float).T)  # one contiguous row per column
+        index = df.index.asi8
+        self.columns = list(df.columns)
+        self.shape = values.shape
+        self.index_dtype = df.index.dtype
+        self.values_memory = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        self.index_memory = shared_memory.SharedMemory(create=True, size=max(1, index.nbytes))
+        np.ndarray(values.shape, dtype=float, buffer=self.values_memory.buf)[:] = values
+        np.ndarray(index.shape, dtype=np.int64, buffer=self.index_memory.buf)[:] = index
+
+    def descriptor(self):
+        """
+        What a worker needs to attach to the shared frame
+        """
+        return self.values_memory.name, self.index_memory.name, self.shape, self.columns, self.index_dtype
+
+    def close(self):
+        self.values_memory.close()
+        self.values_memory.unlink()
+        self.index_memory.close()
+        self.index_memory.unlink()
+
+
+def attach_frame(values_name, index_name, shape, columns, index_dtype):
+    """
+    DataFrame on top of a SharedFrame created in another process
+
+    Returns
+    -------
+    (pd.DataFrame, list)
+        the frame and the shared memory blocks, which have to be kept alive as long as the frame is used
+    """
+    values_memory = shared_memory.SharedMemory(name=values_name)
+    index_memory = shared_memory.SharedMemory(name=index_name)
+    values = np.ndarray(shape, dtype=float, buffer=values_memory.buf)
+    index = pd.Index(np.ndarray(shape[1], dtype=np.int64, buffer=index_memory.buf).view(index_dtype), copy=False)
+    df = pd.DataFrame(values.T, index=index, columns=columns, copy=False)
+    return df, [values_memory, index_memory]
+
+
+_worker_df = None
+_worker_memory = None
+
+
+def _init_worker(descriptor):
+    global _worker_df, _worker_memory
+    _worker_df, _worker_memory = attach_frame(*descriptor)
+
+
+def _run(task):
+    strategy_class, parameters, capital, vectorized = task
+    strategy = strategy_class(**parameters)
+    actual_trades, capital_list = backtest_trades(strategy, _worker_df, capital=capital, vectorized=vectorized)
+    return {**parameters, **performance(_worker_df, actual_trades, capital, capital_list)}
+
+
+def sweep(strategy_class, df, parameters, capital=1000, processes=None, sort_by="return", vectorized=True):
+    """
+    Backtest a strategy for many parameter combinations in parallel
+
+    Parameters
+    ----------
+
+    strategy_class : type
+        class that has Strategy as parent class, it is created with every parameter combination as keyword arguments
+
+    df : pd.DataFrame
+        dataframe containing the trading data, shared with the workers without copying
+
+    parameters : list of dict
+        the parameter combinations, e.g., from parameter_grid or random_parameters
+
+    capital : float
+        capital we can use
+
+    processes : int
+        number of worker processes, all cores if None
+
+    sort_by : str
+        performance measure to rank the results on, highest first
+
+    vectorized : boolean
+        use the vectorized backtest engine when the strategy supports it
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per parameter combination with the parameters and the performance measures, ranked on sort_by
+    """
+    shared = SharedFrame(df)
+    try:
+        tasks = [(strategy_class, params, capital, vectorized) for params in parameters]
+        processes = os.cpu_count() if processes is None else processes
+        with Pool(processes=processes, initializer=_init_worker, initargs=(shared.descriptor(),)) as pool:
+            results = pool.map(_run, tasks, chunksize=max(1, len(tasks) // (4 * processes)))
+    finally:
+        shared.close()
+
+    results = pd.DataFrame(results)
+    if len(results) > 0:
+        results = results.sort_values(sort_by, ascending=False, ignore_index=True)
+    return results
@@ -0,0 +1,221 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import pandas as pd
+
+from Clock import Clock
+from CoinbaseBot import CoinbaseBot
+from Fetcher import HistoricRatesFetcher, TokenBucket
+from LiveEngine import LiveEngine
+from Utils import convert_time_to_str
+
+
+class Portfolio(object):
+    """
+    Trades several products in one process. All symbols share one client, so one connection pool, and one rate
+    limiter. The candles of all symbols are refreshed together once per minute with a single time request, and
+    every symbol runs the strategy and order tasks of a LiveEngine. The capital is divided over the symbols by
+    weight and a buy never uses capital that is committed to the positions and orders of the other symbols.
+    """
+
+    def __init__(self, client, strategies, capital, weights=None, store=None, max_candles=24 * 60, max_workers=8,
+                 rate_limiter=None, clock=None, feed=None, journal=None, verbose=1, **engine_kwargs):
+        """
+        Parameters
+        ----------
+
+        client : cbpro.AuthenticatedClient
+            client shared by all symbols
+
+        strategies : dict
+            symbol, e.g., "BTC-EUR", to the Strategy that trades it. All symbols have to be quoted in the same
+            currency
+
+        capital : float
+            the starting capital of the whole portfolio
+
+        weights : dict
+            symbol to the fraction of the portfolio capital a position can use, equal weights if None
+
+        store : CandleStore
+            optional store to serve the history from
+
+        max_candles : int
+            number of candles that are kept per symbol
+
+        max_workers : int
+            number of symbols that are refreshed at the same time, the rate limiter bounds the request rate
+
+        rate_limiter : TokenBucket
+            rate limiter shared by all requests for candles
+
+        clock : Clock
+            clock used for the time and the waiting, the wall clock if None
+
+        feed : WebSocketFeed
+            streaming feed that delivers the candles of all symbols over one connection, the candles are polled
+            from the REST API if None
+
+        journal : TradeJournal
+            journal the order events and trades of all symbols are appended to as they happen
+
+        engine_kwargs
+            passed to every LiveEngine, e.g., window, cancel_time and poll_interval
+        """
+        self.client = client
+        self.capital = capital
+        self.weights = {symbol: 1 / len(strategies) for symbol in strategies} if weights is None else weights
+        self.clock = Clock() if clock is None else clock
+        self.feed = feed
+        self.journal = journal
+        self.verbose = verbose
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # one fetcher for all symbols; the pages of a symbol are fetched in the refresh thread of that symbol
+        rate_limiter = TokenBucket() if rate_limiter is None else rate_limiter
+        self.fetcher = HistoricRatesFetcher(client, rate_limiter=rate_limiter, max_workers=1)
+        self.engines = {}
+        for symbol, strategy in strategies.items():
+            bot = CoinbaseBot(client=client, capital=0, product_id=symbol, store=store, max_candles=max_candles,
+                              fetcher=self.fetcher, clock=self.clock, journal=journal)
+            self.engines[symbol] = LiveEngine(bot, strategy, clock=self.clock, allocator=self.allocate,
+                                              verbose=verbose, **engine_kwargs)
+        self.refresh_times = []  # seconds per refresh of all symbols
+
+    def log(self, message):
+        if self.verbose:
+            print("Time: %s, %s" % (convert_time_to_str(self.clock.time()), message))
+
+    @property
+    def profit(self):
+        return sum(trade["Profit"] for engine in self.engines.values() for trade in engine.trades)
+
+    def committed(self, exclude=None):
+        """
+        Capital that is in the positions and open buy orders of the symbols
+        """
+        total = 0.0
+        for engine in self.engines.values():
+            if engine is exclude:
+                continue
+            if engine.buy_order is not None:
+                total += float(engine.buy_order['price']) * float(engine.buy_order['filled_size'])
+            if engine.order is not None and engine.order['side'] == 'buy':
+                total += float(engine.order['price']) * float(engine.order['size'])
+        return total
+
+    def allocate(self, engine):
+        """
+        Capital of a new buy order of a symbol: its weight of the current portfolio capital, at most the capital that
+        is not committed to other symbols
+        """
+        equity = self.capital + self.profit
+        free = equity - self.committed(exclude=engine)
+        return max(0.0, min(self.weights[engine.bot.product_id] * equity, free))
+
+    def refresh(self):
+        """
+        Append the closed candles of all symbols, with one time request for all of them
+
+        Returns
+        -------
+        dict
+            symbol to the number of appended candles
+        """
+        now = self.client.get_time()["epoch"]
+
+        def update(engine):
+            try:
+                return engine.api.update_candles(closed_only=True, now=now)
+            except Exception as e:
+                self.log("An error had occured while updating %s: %s" % (engine.bot.product_id, e))
+                return 0
+
+        engines = list(self.engines.values())
+        return {engine.bot.product_id: n for engine, n in zip(engines, self.executor.map(update, engines))}
+
+    async def candle_task(self):
+        """
+        Refresh all symbols as soon as a minute has closed and announce the new candles to their engines
+        """
+        poll_interval = min(engine.poll_interval for engine in self.engines.values())
+        while True:
+            now = self.clock.time()
+            await self.clock.wait(60 - now % 60)
+            next_minute = self.clock.time() + 60
+            waiting = set(self.engines)
+            # the exchange may publish the candles a bit later, retry the missing symbols until the next minute
+            while waiting and self.clock.time() < next_minute - poll_interval:
+                start = perf_counter()
+                appended = await asyncio.to_thread(self.refresh)
+                self.refresh_times.append(perf_counter() - start)
+                for symbol, n in appended.items():
+                    if n > 0:
+                        engine = self.engines[symbol]
+                        engine.bars.put_nowait(engine.api.candles.last_time)
+                        waiting.discard(symbol)
+                if waiting:
+                    await self.clock.wait(poll_interval)
+
+    async def run(self, running_time=60 * 2, lookback=60 * 2):
+        """
+        Run the trading bots of all symbols
+
+        Parameters
+        ----------
+
+        running_time: float
+            amount of time you want to run the portfolio given in minutes
+
+        lookback : int
+            The number of minutes to lookback starting from the current timestamp
+
+        Returns
+        -------
+
+        df_trades: DataFrame
+            a DataFrame containing the trades of all symbols that have taken place in the running time
+        """
+        for engine in self.engines.values():
+            if len(engine.api.candles) == 0:  # only the indicators the strategy of the symbol reads
+                engine.api.require(engine.strategy.features)
+        await asyncio.gather(*[asyncio.to_thread(engine.api.get_minute_data, interval_min=1, lookback=lookback,
+                                                 closed_only=True)
+                               for engine in self.engines.values()])
+
+        tasks = []
+        for engine in self.engines.values():  # also creates the queues the new candles are put on
+            tasks.extend(engine.create_tasks(candles=False))
+        if self.feed is not None:
+            for engine in self.engines.values():
+                self.feed.add(engine.api, engine.bars)
+            tasks.append(asyncio.create_task(self.feed.run()))
+        else:
+            tasks.append(asyncio.create_task(self.candle_task()))
+        try:
+            await self.clock.wait(running_time * 60)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*[engine.close() for engine in self.engines.values()])
+            if self.journal is not None:
+                self.journal.sync()
+
+        self.log("Reached end of the allowed running time, refreshing %d symbols took %.3f s on average" %
+                 (len(self.engines), pd.Series(self.refresh_times, dtype=float).mean()))
+        return pd.DataFrame([trade for engine in self.engines.values() for trade in engine.trades])
+
+
+if __name__ == "__main__":
+    from Clock import AcceleratedClock
+    from SimulatedExchange import SimulatedExchange
+    from Strategy_RSI_SMA_RETURN import Strategy_RSI_SMA_RETURN
+
+    # run a portfolio end to end against the simulated exchange, one minute takes a second
+    clock = AcceleratedClock(start=1_640_995_200, speed=60)
+    exchange = SimulatedExchange(balances={"EUR": 1000.0}, clock=clock)
+    symbols = ["BTC-EUR", "ETH-EUR", "DOT-EUR", "ADA-EUR"]
+    portfolio = Portfolio(exchange, {symbol: Strategy_RSI_SMA_RETURN() for symbol in symbols}, capital=1000,
+                          rate_limiter=TokenBucket(clock=clock), clock=clock)
+    print(asyncio.run(portfolio.run(running_time=10, lookback=24 * 60)))
@@ -0,0 +1,164 @@
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from Backtesting import backtest
+from Clock import VirtualClock
+from CoinbaseAPI import CoinbaseAPI
+from CoinbaseBot import CoinbaseBot
+from Fetcher import HistoricRatesFetcher, TokenBucket
+from MarketData import CandleFrame
+from SimulatedExchange import SimulatedExchange
+
+
+def replay(strategy, candles, capital=1000, product_id='BTC-EUR', lookback=60 * 2, running_time=None, window=200,
+           cancel_time=30, verbose=0, **exchange_kwargs):
+    """
+    Replay CoinbaseBot.run over historical candles. The bot runs its exact decision and order logic against a
+    SimulatedExchange that replays the candles on a VirtualClock, so sleep(60) returns immediately and a 12 hour
+    session takes seconds. Every decision is checked against the decision the backtest makes on the same candle.
+
+    Parameters
+    ----------
+
+    strategy : Strategy
+        Object that inherits from Strategy
+
+    candles : np.ndarray
+        (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time, e.g., from
+        CandleStore.read. The first lookback minutes are the history of the bot
+
+    capital : float
+        the starting capital
+
+    product_id : str
+        string of the currency
+
+    lookback : int
+        The number of minutes of history the bot starts with
+
+    running_time : float
+        number of minutes to run, until the last candle if None
+
+    window, cancel_time :
+        see CoinbaseBot.run
+
+    exchange_kwargs
+        passed to the SimulatedExchange, e.g., participation and fee_rate
+
+    Returns
+    -------
+    ReplayResult
+        the decisions with their latency, the trades of the bot and the backtest over the same period
+    """
+    candles = np.asarray(candles, dtype=float)
+    base, quote = product_id.split("-")
+
+    # the first decision is one second after the lookback minutes have closed
+    start = np.ceil(candles[0, 0] / 60) * 60 + lookback * 60 + 60 + 1
+    if running_time is None:
+        running_time = (candles[-1, 0] + 60 - start) / 60 + 1
+    clock = VirtualClock(start)
+    exchange = SimulatedExchange(balances={quote: capital}, history={product_id: candles}, clock=clock,
+                                 closed_only=True, **exchange_kwargs)
+    fetcher = HistoricRatesFetcher(exchange, rate_limiter=TokenBucket(clock=clock))
+    bot = CoinbaseBot(client=exchange, capital=capital, product_id=product_id, fetcher=fetcher, clock=clock,
+                     record_ticks=True)
+
+    wall_start = perf_counter()
+    bot.run(strategy, lookback=lookback, running_time=running_time, cancel_time=cancel_time, window=window,
+            save=False, verbose=verbose)
+    wall_time = perf_counter() - wall_start
+
+    ticks = pd.DataFrame(bot.ticks)
+    n_trades = len(bot.df_trades_dict["Sell ID"])
+    trades = pd.DataFrame({key: values[:n_trades] for key, values in bot.df_trades_dict.items()})
+    last_close = candles[candles[:, 0] <= clock.time() - 60, 4][-1]
+    end_capital = exchange.balances.get(quote, 0.0) + exchange.balances.get(base, 0.0) * last_close
+
+    # the same candles with the indicators computed in one batch, like the backtest data
+    first = np.ceil((start - 60 - lookback * 60) / 60) * 60
+    api = CoinbaseAPI(client=exchange, symbol=product_id)
+    api.append_candles(candles[candles[:, 0] >= first])
+    frame = api.frame()  # a view, the decisions and the backtest do not copy the candles
+
+    decisions = backtest_decisions(strategy, frame, ticks, window=window)
+    backtest_result = backtest(strategy, frame.between(ticks["Time"].iloc[0]), capital=capital, symbol=product_id,
+                               verbose=0)
+    return ReplayResult(ticks, decisions, trades, backtest_result, capital, end_capital, wall_time)
+
+
+def backtest_decisions(strategy, df, ticks, window=200):
+    """
+    The action of the strategy on the batch data for every decision of the bot, given the same position
+
+    Returns
+    -------
+    pd.Series
+        the expected action per tick
+    """
+    positions = df.index.get_indexer(ticks["Time"])
+    expected = []
+    for position, (_, tick) in zip(positions, ticks.iterrows()):
+        frame = df[max(0, position + 1 - window):position + 1]
+        frame = frame.to_frame() if isinstance(frame, CandleFrame) else frame.copy()
+        frame["last_buying_price"] = tick["Last buying price"]
+        expected.append(strategy.action(frame, entried=tick["Entried"]))
+    return pd.Series(expected, index=ticks.index, name="Backtest action")
+
+
+class ReplayResult(object):
+    """
+    Results of a replay of CoinbaseBot.run
+    """
+
+    def __init__(self, ticks, decisions, trades, backtest_result, capital, end_capital, wall_time):
+        self.ticks = ticks
+        self.decisions = decisions
+        self.trades = trades
+        self.backtest_result = backtest_result
+        self.capital = capital
+        self.end_capital = end_capital
+        self.wall_time = wall_time
+
+    @property
+    def mismatches(self):
+        """
+        Ticks where the bot decided differently than the backtest
+        """
+        differ = self.ticks["Action"] != self.decisions
+        return self.ticks[differ].assign(**{"Backtest action": self.decisions[differ]})
+
+    @property
+    def matches(self):
+        return len(self.mismatches) == 0
+
+    def latency(self, quantile):
+        return self.ticks["Latency"].quantile(quantile)
+
+    @property
+    def texts(self):
+        backtest_measures = self.backtest_result.measures
+        return [f"ticks: {len(self.ticks)} in {self.wall_time:.2f} s ({len(self.ticks) / self.wall_time:.0f} per s)",
+                f"decision latency p50: {1000 * self.latency(0.5):.3f} ms, p99: {1000 * self.latency(0.99):.3f} ms, "
+                f"max: {1000 * self.ticks['Latency'].max():.3f} ms",
+                f"decisions matching the backtest: {len(self.ticks) - len(self.mismatches)}/{len(self.ticks)}",
+                f"trades: {len(self.trades)}, backtest trades: {backtest_measures['trades']}",
+                f"return: {self.end_capital / self.capital - 1:.6f}, "
+                f"backtest return: {backtest_measures['return']:.6f}"]
+
+    def summary(self):
+        return '\n'.join(self.texts)
+
+
+if __name__ == "__main__":
+    from CandleStore import CandleStore
+    from Strategy_RSI_SMA_RETURN import Strategy_RSI_SMA_RETURN
+
+    # replay the last 12 hours, with one day of history for the indicators
+    store = CandleStore()
+    last = store.last_time('BTC-EUR', 60)
+    candles = store.read('BTC-EUR', 60, last - (24 + 12) * 60 * 60, last)
+    result = replay(Strategy_RSI_SMA_RETURN(), candles, product_id='BTC-EUR', lookback=24 * 60)
+    print(result.summary())
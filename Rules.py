@@ -0,0 +1,180 @@
+import ast
+
+import numpy as np
+
+from MarketData import CandleFrame
+
+# the only syntax a rule may use, e.g., calls, attributes and subscripts are rejected
+OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">",
+             ast.GtE: ">=", ast.Eq: "==", ast.NotEq: "!="}
+
+
+def _numexpr():
+    try:
+        import numexpr
+    except ImportError:
+        return None
+    return numexpr
+
+
+def column_values(df, name):
+    """
+    Values of a column of a DataFrame or CandleFrame as an array, without a copy where possible
+    """
+    if isinstance(df, CandleFrame):
+        return df.column(name)
+    return df[name].to_numpy()
+
+
+def last_values(df, columns):
+    """
+    Values of columns in the last row of a DataFrame or CandleFrame as a dict, only these columns are read, so the
+    cost does not depend on the width or the dtypes of the frame
+
+    Parameters
+    ----------
+
+    df : pd.DataFrame or CandleFrame
+        the candles, e.g., the window of the live bot
+
+    columns : list of str
+        the columns to read
+
+    Returns
+    -------
+    dict
+        the value per column
+    """
+    if isinstance(df, CandleFrame):
+        return {name: df.column(name)[-1] for name in columns}
+    return {name: df[name].iat[-1] for name in columns}
+
+
+class Rule(object):
+    """
+    Condition on the columns of the candles written as a Python expression, e.g.,
+    "EMA50 > EMA200 and RSI < RSI_buy". It is parsed once and compiled into a vectorized expression that evaluates
+    the whole history in one pass with NumPy, or numexpr when it is installed, and into a scalar function of the
+    values of one row for the live bot, so the backtest and the bot run the same definition.
+    """
+
+    def __init__(self, expression, parameters=None):
+        """
+        Parameters
+        ----------
+
+        expression : str
+            the condition, with the comparisons, arithmetic, and, or and not of Python on column names, numbers and
+            parameters
+
+        parameters : dict
+            values of the names that are not columns, e.g., {"RSI_buy": 40}, they are compiled in as constants
+        """
+        self.expression = expression
+        self.parameters = {} if parameters is None else dict(parameters)
+        self.compile()
+
+    def compile(self):
+        tree = ast.parse(self.expression.strip(), mode="eval")
+        self.columns = []  # the columns the rule reads, in order of appearance
+        self.vector_source = self.source(tree.body, vectorized=True)
+        scalar_source = self.source(tree.body, vectorized=False)
+        self.vector_code = compile(self.vector_source, f"<rule {self.expression!r}>", "eval")
+        self.evaluate = eval(compile(f"lambda values: {scalar_source}", f"<rule {self.expression!r}>", "eval"),
+                             {"__builtins__": {}})
+
+    def source(self, node, vectorized):
+        """
+        Python source of a node of the rule, with the element-wise operators of NumPy if vectorized and with the
+        columns read from a dict of values otherwise
+        """
+        if isinstance(node, ast.BoolOp):
+            if vectorized:
+                operator = " & " if isinstance(node.op, ast.And) else " | "
+            else:
+                operator = " and " if isinstance(node.op, ast.And) else " or "
+            return "(" + operator.join(self.source(value, vectorized) for value in node.values) + ")"
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub)):
+            operator = "-" if isinstance(node.op, ast.USub) else "~" if vectorized else "not "
+            return f"({operator}{self.source(node.operand, vectorized)})"
+        if isinstance(node, ast.Compare) and all(type(op) in OPERATORS for op in node.ops):
+            operands = [self.source(operand, vectorized) for operand in [node.left] + node.comparators]
+            comparisons = [f"({a} {OPERATORS[type(op)]} {b})" for a, op, b in zip(operands, node.ops, operands[1:])]
+            # a chained comparison, e.g., 30 < RSI < 70, is the conjunction of its comparisons
+            operator = " & " if vectorized else " and "
+            return comparisons[0] if len(comparisons) == 1 else "(" + operator.join(comparisons) + ")"
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            left, right = self.source(node.left, vectorized), self.source(node.right, vectorized)
+            return f"({left} {OPERATORS[type(node.op)]} {right})"
+        if isinstance(node, ast.Constant) and isinstance(node.value, (bool, int, float)):
+            return repr(node.value)
+        if isinstance(node, ast.Name):
+            if node.id in self.parameters:
+                value = self.parameters[node.id]
+                if not isinstance(value, (bool, int, float, np.number)):
+                    raise ValueError(f"parameter {node.id} of rule {self.expression!r} is not a number: {value!r}")
+                return repr(float(value))
+            if node.id not in self.columns:
+                self.columns.append(node.id)
+            return node.id if vectorized else f"values[{node.id!r}]"
+        raise ValueError(f"unsupported syntax in rule {self.expression!r}: {ast.unparse(node)}")
+
+    def signals(self, df):
+        """
+        Vectorized value of the rule for every row
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame or CandleFrame
+            the candles with the columns of the rule, e.g., the full history of a backtest
+
+        Returns
+        -------
+        np.ndarray
+            boolean array with the value of each row, a comparison with a missing value is False
+        """
+        columns = {name: column_values(df, name) for name in self.columns}
+        numexpr = _numexpr()
+        if numexpr is not None and len(self.columns) > 0:
+            result = numexpr.evaluate(self.vector_source, local_dict=columns, global_dict={})
+        else:
+            result = eval(self.vector_code, {"__builtins__": {}}, columns)
+        result = np.asarray(result, dtype=bool)
+        return result if result.ndim > 0 else np.full(len(df), bool(result))
+
+    def last(self, df):
+        """
+        Value of the rule in the last row, see last_values
+        """
+        return self.evaluate(last_values(df, self.columns))
+
+    def __getstate__(self):
+        return {"expression": self.expression, "parameters": self.parameters}  # the compiled functions are rebuilt
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile()
+
+    def __repr__(self):
+        return f"Rule({self.expression!r})"
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+    from Benchmarks import indicator_frame, synthetic_candles
+
+    df = indicator_frame(synthetic_candles(1_000_000))
+    rule = Rule("EMA50 > EMA200 and RSI < RSI_buy and CUM_RETURNS_60 > returns_buy",
+                {"RSI_buy": 40, "returns_buy": 1.0})
+
+    start = perf_counter()
+    signals = rule.signals(df)
+    elapsed = perf_counter() - start
+    print(f"{rule}: {signals.sum()} signals in {len(df)} bars, {len(df) / elapsed / 1e6:.1f}M bars/sec")
+
+    window = df.iloc[-200:]
+    start = perf_counter()
+    for _ in range(1000):
+        rule.last(window)
+    print(f"last row: {(perf_counter() - start) / 1000 * 1e6:.1f} us per tick")
@@ -0,0 +1,299 @@
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+class SyntheticClient(object):
+    """
+    Local stand-in for the public part of cbpro.PublicClient that returns synthetic candles, to run the data
+    pipeline without exchange access. The candles only depend on their timestamp, so overlapping requests agree.
+    """
+
+    def __init__(self, now=1_640_995_200, price=40000.0, failure_rate=0.0, seed=0, max_requests=300, clock=None):
+        """
+        Parameters
+        ----------
+
+        now : float
+            epoch seconds returned by get_time, no candles are returned after it
+
+        price : float
+            price level of the candles
+
+        failure_rate : float
+            probability that a request returns an error message instead of candles
+
+        seed : int
+            seed of the failures
+
+        max_requests : int
+            maximum number of candles per request, larger requests return an error message like the exchange does
+
+        clock : Clock
+            clock that gives the current time instead of now, e.g., an AcceleratedClock
+        """
+        self.clock = clock
+        self._now = now
+        self.price = price
+        self.failure_rate = failure_rate
+        self.max_requests = max_requests
+        self.rng = np.random.default_rng(seed)
+        self.n_requests = 0
+
+    @property
+    def now(self):
+        return self.clock.time() if self.clock is not None else self._now
+
+    @now.setter
+    def now(self, now):
+        self._now = now
+
+    def get_time(self):
+        return {"iso": pd.to_datetime(self.now, unit="s").isoformat(), "epoch": float(self.now)}
+
+    def candles(self, times):
+        """
+        Candles for the given epoch seconds as a (n, 6) array with rows [time, low, high, open, close, volume]
+        """
+        times = np.asarray(times, dtype=float)
+        trend = 0.05 * np.sin(times / 86400) + 0.01 * np.sin(times / 3607) + 0.002 * np.sin(times / 311)
+        close = self.price * (1 + trend)
+        open_ = self.price * (1 + trend - 0.0005 * np.cos(times / 97))
+        low = np.minimum(open_, close) * 0.9995
+        high = np.maximum(open_, close) * 1.0005
+        volume = 1 + 0.5 * np.sin(times / 53) ** 2
+        return np.column_stack([times, low, high, open_, close, volume])
+
+    def get_product_historic_rates(self, product_id, start=None, end=None, granularity=None):
+        self.n_requests += 1
+        if self.rng.random() < self.failure_rate:
+            return {"message": "Slow rate limit exceeded"}
+
+        granularity = 60 if granularity is None else int(granularity)
+        end = self.published() if end is None else min(pd.Timestamp(end).timestamp(), self.published())
+        start = end - granularity * (self.max_requests - 1) if start is None else pd.Timestamp(start).timestamp()
+        if (end - start) / granularity + 1 > self.max_requests:
+            return {"message": "granularity too small for the requested time range"}
+        return self.market_candles(product_id, start, end, granularity)[::-1].tolist()
+
+    def published(self):
+        """
+        Time of the last candle that can be requested
+        """
+        return self.now
+
+    def market_candles(self, product_id, start, end, granularity=60):
+        """
+        Candles of a product with start <= time <= end as a (n, 6) array sorted on time
+        """
+        return self.candles(np.arange(np.ceil(start / granularity) * granularity, end + 1, granularity))
+
+
+class SimulatedExchange(SyntheticClient):
+    """
+    In-process stand-in for cbpro.AuthenticatedClient with the methods the bots use. It replays stored candles, or
+    the synthetic ones, on the time of its clock, so with an AcceleratedClock the live code runs many times faster
+    than real time. A limit order is filled by the closed candles after it was placed that trade through its price,
+    every candle can fill at most a fraction of its volume, so large orders are filled partially over several
+    candles. Open orders hold the funds they need, so the available balances are the ones of the exchange.
+    """
+
+    def __init__(self, balances=None, history=None, store=None, granularity=60, participation=1.0, fee_rate=0.0,
+                 closed_only=False, **kwargs):
+        """
+        Parameters
+        ----------
+
+        balances : dict
+            currency to the starting balance, 1000 EUR if None
+
+        history : dict
+            product to a (n, 6) array with the rows [time, low, high, open, close, volume] sorted on time that is
+            replayed, products without history get synthetic candles
+
+        store : CandleStore
+            store with the candles of the products that are not in history, a product is loaded on its first use
+
+        granularity : int
+            seconds between the replayed candles
+
+        participation : float
+            fraction of the volume of a candle that can fill our orders
+
+        fee_rate : float
+            fee as a fraction of the value of every fill, paid in the quote currency
+
+        closed_only : boolean
+            only publish the candles of intervals that have ended. A replayed candle is complete from its start on,
+            so otherwise the candle of the current minute shows its future close
+
+        kwargs
+            see SyntheticClient
+        """
+        super().__init__(**kwargs)
+        self.balances = {"EUR": 1000.0} if balances is None else dict(balances)
+        self.holds = {}
+        self.history = {} if history is None else dict(history)
+        self.store = store
+        self.granularity = granularity
+        self.participation = participation
+        self.fee_rate = fee_rate
+        self.closed_only = closed_only
+        self.orders = {}
+        self.lock = threading.RLock()  # the bots call the exchange from several threads
+
+    def published(self):
+        return self.now - self.granularity if self.closed_only else self.now
+
+    def product_history(self, product_id):
+        if product_id not in self.history and self.store is not None:
+            candles = self.store.read(product_id, self.granularity, 0, np.inf)
+            if len(candles) > 0:
+                self.history[product_id] = np.ascontiguousarray(candles)
+        return self.history.get(product_id)
+
+    def market_candles(self, product_id, start, end, granularity=60):
+        history = self.product_history(product_id)
+        if history is None:
+            return super().market_candles(product_id, start, end, granularity)
+        if granularity != self.granularity:
+            raise ValueError(f"only {self.granularity} second candles are replayed, not {granularity}")
+        first = np.searchsorted(history[:, 0], start, side="left")
+        last = np.searchsorted(history[:, 0], end, side="right")
+        return history[first:last]
+
+    def last_price(self, product_id):
+        end = self.published()
+        candles = self.market_candles(product_id, end - 60 * self.granularity, end, self.granularity)
+        if len(candles) == 0:
+            raise ValueError(f"no candles of {product_id} before {end}")
+        return float(candles[-1, 4])
+
+    def currencies(self, product_id):
+        base, quote = product_id.split("-")
+        return base, quote
+
+    def available(self, currency):
+        return self.balances.get(currency, 0.0) - self.holds.get(currency, 0.0)
+
+    def get_accounts(self):
+        with self.lock:
+            return [{"currency": currency, "balance": f"{balance:.8f}",
+                     "available": f"{self.available(currency):.8f}", "hold": f"{self.holds.get(currency, 0.0):.8f}"}
+                    for currency, balance in self.balances.items()]
+
+    def public(self, order):
+        return {key: value for key, value in order.items() if not key.startswith("_")}
+
+    def place_limit_order(self, product_id, side, price, size, **kwargs):
+        with self.lock:
+            price, size = round(float(price), 8), round(float(size), 8)
+            base, quote = self.currencies(product_id)
+            currency, amount = (quote, price * size * (1 + self.fee_rate)) if side == "buy" else (base, size)
+            if size <= 0 or amount > self.available(currency) + 1e-9:
+                return {"message": "Insufficient funds"}
+
+            self.holds[currency] = self.holds.get(currency, 0.0) + amount
+            now = self.now
+            order = {"id": str(uuid.uuid4()), "product_id": product_id, "side": side, "type": "limit",
+                     "price": f"{price:.8f}", "size": f"{size:.8f}", "filled_size": "0.00000000",
+                     "fill_fees": "0.0000000000", "executed_value": "0.0000000000", "status": "open", "settled": False,
+                     "created_at": pd.to_datetime(now, unit="s").isoformat(),
+                     "_filled": 0.0, "_checked": np.floor(now / self.granularity) * self.granularity + self.granularity}
+            self.orders[order["id"]] = order
+            return self.public(order)
+
+    def place_market_order(self, product_id, side, size=None, funds=None, **kwargs):
+        with self.lock:
+            price = self.last_price(product_id)
+            size = float(size) if size is not None else float(funds) / (price * (1 + self.fee_rate))
+            order = self.place_limit_order(product_id, side, price, size)
+            if "id" in order:
+                order = self.orders[order["id"]]
+                order["type"] = "market"
+                self.fill(order, size)
+                order = self.public(order)
+            return order
+
+    def fill(self, order, size):
+        """
+        Fill size of an order at its limit price
+        """
+        base, quote = self.currencies(order["product_id"])
+        price = float(order["price"])
+        value, fee = price * size, price * size * self.fee_rate
+        if order["side"] == "buy":
+            self.holds[quote] -= value + fee
+            self.balances[quote] = self.balances.get(quote, 0.0) - value - fee
+            self.balances[base] = self.balances.get(base, 0.0) + size
+        else:
+            self.holds[base] -= size
+            self.balances[base] = self.balances.get(base, 0.0) - size
+            self.balances[quote] = self.balances.get(quote, 0.0) + value - fee
+
+        order["_filled"] += size
+        order.update({"filled_size": f"{order['_filled']:.8f}",
+                      "fill_fees": f"{float(order['fill_fees']) + fee:.10f}",
+                      "executed_value": f"{float(order['executed_value']) + value:.10f}"})
+        if order["_filled"] >= float(order["size"]) - 1e-12:
+            self.done(order, "filled")
+
+    def done(self, order, reason):
+        order.update({"status": "done", "done_reason": reason, "settled": True,
+                      "done_at": pd.to_datetime(self.now, unit="s").isoformat()})
+
+    def match(self, order):
+        """
+        Fill an open limit order with the candles that closed since it was last matched
+        """
+        if order["status"] != "open":
+            return
+        end = self.now - self.granularity  # start of the last closed candle
+        if end < order["_checked"]:
+            return
+        candles = self.market_candles(order["product_id"], order["_checked"], end, self.granularity)
+        order["_checked"] = end + self.granularity
+        price = float(order["price"])
+        crossed = candles[:, 1] <= price if order["side"] == "buy" else candles[:, 2] >= price
+        if not crossed.any():
+            return
+        liquidity = self.participation * candles[crossed, 5].sum()
+        remaining = float(order["size"]) - order["_filled"]
+        self.fill(order, min(remaining, liquidity))
+
+    def get_order(self, order_id):
+        with self.lock:
+            if order_id not in self.orders:
+                return {"message": "NotFound"}
+            order = self.orders[order_id]
+            self.match(order)
+            return self.public(order)
+
+    def get_orders(self, **kwargs):
+        with self.lock:
+            for order in self.orders.values():
+                self.match(order)
+            return [self.public(order) for order in self.orders.values() if order["status"] == "open"]
+
+    def cancel_order(self, order_id):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return {"message": "NotFound"}
+            self.match(order)
+            if order["status"] != "open":
+                return {"message": "Order already done"}
+
+            base, quote = self.currencies(order["product_id"])
+            remaining = float(order["size"]) - order["_filled"]
+            if order["side"] == "buy":
+                self.holds[quote] -= remaining * float(order["price"]) * (1 + self.fee_rate)
+            else:
+                self.holds[base] -= remaining
+            if order["_filled"] > 0:  # the exchange keeps partially filled orders
+                self.done(order, "canceled")
+            else:
+                del self.orders[order_id]
+            return order_id
@@ -0,0 +1,284 @@
+import json
+import os
+import sqlite3
+import threading
+from time import monotonic, time as current_time
+
+import pandas as pd
+
+# the columns of a trade as the bots name them and as they are stored
+TRADE_COLUMNS = {"Buy date": "buy_date",
+                 "Buy price": "buy_price",
+                 "Buy size": "buy_size",
+                 "Buy ID": "buy_id",
+                 "Sell date": "sell_date",
+                 "Sell price": "sell_price",
+                 "Sell size": "sell_size",
+                 "Sell ID": "sell_id",
+                 "Start capital": "start_capital",
+                 "End capital": "end_capital",
+                 "Return": "trade_return",
+                 "Profit": "profit",
+                 "Product ID": "product_id"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    product_id TEXT,
+    event TEXT NOT NULL,
+    order_id TEXT,
+    side TEXT,
+    price REAL,
+    size REAL,
+    filled_size REAL,
+    status TEXT,
+    created_at TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_product_time ON events (product_id, time);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_order ON events (order_id);
+
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    buy_date TEXT,
+    buy_price REAL,
+    buy_size REAL,
+    buy_id TEXT,
+    sell_date TEXT,
+    sell_price REAL,
+    sell_size REAL,
+    sell_id TEXT,
+    start_capital REAL,
+    end_capital REAL,
+    trade_return REAL,
+    profit REAL,
+    product_id TEXT
+);
+CREATE INDEX IF NOT EXISTS trades_product_time ON trades (product_id, time);
+CREATE INDEX IF NOT EXISTS trades_time ON trades (time);
+CREATE INDEX IF NOT EXISTS trades_buy ON trades (buy_id);
+CREATE INDEX IF NOT EXISTS trades_sell ON trades (sell_id);
+"""
+
+APPEND_ONLY = """
+CREATE TRIGGER IF NOT EXISTS {table}_no_update BEFORE UPDATE ON {table}
+BEGIN SELECT RAISE(ABORT, 'the trade journal is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS {table}_no_delete BEFORE DELETE ON {table}
+BEGIN SELECT RAISE(ABORT, 'the trade journal is append-only'); END;
+"""
+
+
+def _epoch(value):
+    """
+    Epoch seconds of a time given as epoch seconds, a timestamp or a date string in UTC
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return pd.Timestamp(value).timestamp()
+
+
+class TradeJournal(object):
+    """
+    Append-only journal of the order events and trades of the bots in SQLite in WAL mode.
+
+    Every event is committed as soon as it happens, so a crash of the bot loses nothing: the commit is in the
+    write-ahead log. The log is only fsynced by the first commit after sync_interval seconds, or by sync, so a
+    burst of events costs one fsync and a power loss loses at most the events since the last sync. The rows can
+    never be updated or deleted and are indexed on product, time and order ID.
+    """
+
+    def __init__(self, path="data/trades.sqlite", sync_interval=1.0):
+        """
+        Parameters
+        ----------
+
+        path : str
+            SQLite file of the journal, it is created with its directory if it does not exist
+
+        sync_interval : float
+            minimum number of seconds between two fsyncs of the write-ahead log, 0 to fsync every event
+        """
+        self.path = path
+        self.sync_interval = sync_interval
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # autocommit: every event is its own transaction. The REST calls of the LiveEngine run in threads, so one
+        # connection is shared under a lock
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA + APPEND_ONLY.format(table="events") + APPEND_ONLY.format(table="trades"))
+        self.last_sync = monotonic()
+        self.pending = False  # events that are committed but not fsynced yet
+
+    def append(self, sql, parameters):
+        with self.lock:
+            full = monotonic() - self.last_sync >= self.sync_interval
+            if full:  # this commit fsyncs the log, with the events of the commits before it
+                self.connection.execute("PRAGMA synchronous=FULL")
+            self.connection.execute(sql, parameters)
+            if full:
+                self.connection.execute("PRAGMA synchronous=NORMAL")
+                self.last_sync = monotonic()
+            self.pending = not full
+
+    def record_order(self, order, event, product_id=None, time=None):
+        """
+        Append an event of an order
+
+        Parameters
+        ----------
+
+        order : dict
+            the order as returned by the Coinbase Pro API
+
+        event : str
+            what happened, e.g., "placed", "rejected", "done" or "canceled"
+
+        product_id : str
+            product of the order, the product_id of the order if None
+
+        time : float
+            epoch seconds of the event, the current time if None
+        """
+        def number(key):
+            return None if order.get(key) is None else float(order[key])
+
+        product_id = order.get("product_id") if product_id is None else product_id
+        self.append("INSERT INTO events (time, product_id, event, order_id, side, price, size, filled_size, status, "
+                    "created_at, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (current_time() if time is None else time, product_id, event, order.get("id"),
+                     order.get("side"), number("price"), number("size"), number("filled_size"), order.get("status"),
+                     order.get("created_at"), json.dumps(order, default=str)))
+
+    def record_trade(self, trade, time=None):
+        """
+        Append a completed trade
+
+        Parameters
+        ----------
+
+        trade : dict
+            the trade with the keys of TRADE_COLUMNS, e.g., "Buy price" and "Sell ID"
+
+        time : float
+            epoch seconds of the trade, the current time if None
+        """
+        columns = ", ".join(TRADE_COLUMNS.values())
+        self.append(f"INSERT INTO trades (time, {columns}) VALUES (?{', ?' * len(TRADE_COLUMNS)})",
+                    [current_time() if time is None else time] + [trade[key] for key in TRADE_COLUMNS])
+
+    def sync(self):
+        """
+        Fsync the events that are committed but not fsynced yet, e.g., when the bot stops
+        """
+        with self.lock:
+            if self.pending:
+                # in WAL mode with synchronous=NORMAL the log is fsynced before every checkpoint
+                self.connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                self.last_sync = monotonic()
+                self.pending = False
+
+    def query(self, table, product_id=None, start=None, end=None, order_id=None):
+        conditions, parameters = [], []
+        if product_id is not None:
+            conditions.append("product_id = ?")
+            parameters.append(product_id)
+        if start is not None:
+            conditions.append("time >= ?")
+            parameters.append(_epoch(start))
+        if end is not None:
+            conditions.append("time < ?")
+            parameters.append(_epoch(end))
+        if order_id is not None:
+            conditions.append("order_id = ?" if table == "events" else "(buy_id = ? OR sell_id = ?)")
+            parameters += [order_id] if table == "events" else [order_id, order_id]
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        with self.lock:
+            return pd.read_sql_query(f"SELECT * FROM {table}{where} ORDER BY id", self.connection, params=parameters)
+
+    def events(self, product_id=None, start=None, end=None, order_id=None):
+        """
+        Order events, optionally only of a product, between start and end or of an order
+
+        Parameters
+        ----------
+
+        product_id : str
+            only the events of this product
+
+        start, end : float, pd.Timestamp or str
+            only the events from start until end, as epoch seconds or UTC times
+
+        order_id : str
+            only the events of this order
+
+        Returns
+        -------
+        pd.DataFrame
+            the events in the order they happened, the full order is in the data column as JSON
+        """
+        return self.query("events", product_id=product_id, start=start, end=end, order_id=order_id)
+
+    def trades(self, product_id=None, start=None, end=None, order_id=None):
+        """
+        Completed trades with the columns of the bots, e.g., "Buy price", see events for the parameters, order_id
+        is the ID of the buy or the sell order
+        """
+        df = self.query("trades", product_id=product_id, start=start, end=end, order_id=order_id)
+        names = {column: key for key, column in TRADE_COLUMNS.items()}
+        return df.drop(columns="id").rename(columns={"time": "Time", **names})
+
+    def export_parquet(self, path, table="trades"):
+        """
+        Export a whole table to a Parquet file for analysis, needs pyarrow or fastparquet
+
+        Parameters
+        ----------
+
+        path : str
+            the Parquet file
+
+        table : str
+            "trades" or "events"
+        """
+        if table not in ("trades", "events"):
+            raise ValueError(f"unknown table: {table}")
+        with self.lock:
+            df = pd.read_sql_query(f"SELECT * FROM {table} ORDER BY id", self.connection)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(path, index=False)
+        return path
+
+    def close(self):
+        self.sync()
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+    from time import perf_counter
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = TradeJournal(os.path.join(directory, "trades.sqlite"))
+        n = 10_000
+        start = perf_counter()
+        for i in range(n):
+            order = {"id": f"order-{i}", "product_id": "BTC-EUR", "side": "buy" if i % 2 == 0 else "sell",
+                     "price": "40000.00", "size": "0.0025", "filled_size": "0.0025", "status": "done",
+                     "created_at": pd.to_datetime(1_640_995_200 + 60 * i, unit="s").isoformat()}
+            journal.record_order(order, "done", time=1_640_995_200 + 60 * i)
+        print(f"{(perf_counter() - start) / n * 1e6:.1f} us per event")
+
+        print(journal.events(order_id="order-42")[["time", "event", "order_id", "side", "price"]])
+        print(len(journal.events(product_id="BTC-EUR", start="2022-01-02", end="2022-01-03")), "events on 2022-01-02")
+        try:
+            journal.connection.execute("DELETE FROM events")
+        except sqlite3.DatabaseError as e:
+            print(e)
+        journal.close()
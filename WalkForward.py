@@ -0,0 +1,175 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from Backtesting import backtest_trades, performance
+from CoinbaseAPI import CoinbaseAPI
+from Optimization import SharedFrame, attach_frame
+from Utils import obtain_period_data
+
+
+def load_symbols(client, symbols, lookback=30 * 24 * 60, store=None):
+    """
+    Load the minute data of several symbols, the indicators are computed once per symbol over the whole period
+
+    Returns
+    -------
+    dict
+        symbol to its dataframe with the candles and indicators
+    """
+    return {symbol: CoinbaseAPI(client=client, symbol=symbol, store=store).get_minute_data(lookback=lookback)
+            for symbol in symbols}
+
+
+def walk_forward_windows(index, train="14D", test="7D", step=None):
+    """
+    Walk-forward train/test windows over a time index
+
+    Parameters
+    ----------
+
+    index : pd.DatetimeIndex
+        time index of the data
+
+    train : str or pd.Timedelta
+        length of the train period
+
+    test : str or pd.Timedelta
+        length of the test period that directly follows the train period
+
+    step : str or pd.Timedelta
+        shift between consecutive windows, the test length if None so the test periods do not overlap
+
+    Returns
+    -------
+    list of tuple
+        (train_start, train_end, test_start, test_end) per window, the ends are inclusive like obtain_period_data
+    """
+    train, test = pd.Timedelta(train), pd.Timedelta(test)
+    step = test if step is None else pd.Timedelta(step)
+    just_before = pd.Timedelta(seconds=1)
+
+    windows = []
+    start = index[0]
+    while start + train + test <= index[-1] + just_before:
+        windows.append((start, start + train - just_before, start + train, start + train + test - just_before))
+        start += step
+    return windows
+
+
+def best_parameters(strategy_class, df, parameters, capital=1000, sort_by="return", vectorized=True):
+    """
+    The parameter combination with the best performance on df, ties go to the first combination
+
+    Returns
+    -------
+    (dict, dict)
+        the best parameters and their performance measures
+    """
+    best, best_measures = None, None
+    for params in parameters:
+        actual_trades, capital_list = backtest_trades(strategy_class(**params), df, capital=capital,
+                                                      vectorized=vectorized)
+        measures = performance(df, actual_trades, capital, capital_list)
+        if best is None or np.nan_to_num(measures[sort_by], nan=-np.inf) > \
+                np.nan_to_num(best_measures[sort_by], nan=-np.inf):
+            best, best_measures = params, measures
+    return best, best_measures
+
+
+_worker_data = {}
+_worker_memory = []
+
+
+def _init_worker(descriptors):
+    for symbol, descriptor in descriptors.items():
+        _worker_data[symbol], memory = attach_frame(*descriptor)
+        _worker_memory.extend(memory)
+
+
+def _run_window(task):
+    symbol, window, strategy_class, parameters, capital, sort_by, vectorized = task
+    train_start, train_end, test_start, test_end = window
+    df = _worker_data[symbol]
+
+    # choose the parameters on the train period, a fixed strategy skips this step
+    params, train_measures = {}, {}
+    if parameters:
+        params, train_measures = best_parameters(strategy_class, obtain_period_data(df, train_start, train_end),
+                                                 parameters, capital=capital, sort_by=sort_by, vectorized=vectorized)
+
+    test_df = obtain_period_data(df, test_start, test_end)
+    actual_trades, capital_list = backtest_trades(strategy_class(**params), test_df, capital=capital,
+                                                  vectorized=vectorized)
+    measures = performance(test_df, actual_trades, capital, capital_list)
+
+    result = {"symbol": symbol, "train_start": train_start, "train_end": train_end, "test_start": test_start,
+              "test_end": test_end, **params, **measures}
+    if parameters:
+        result[f"train {sort_by}"] = train_measures[sort_by]
+    return result
+
+
+def walk_forward(strategy_class, data, train="14D", test="7D", step=None, parameters=None, capital=1000,
+                 processes=None, sort_by="return", vectorized=True):
+    """
+    Walk-forward backtest of a strategy over several symbols, the windows of all symbols run in parallel
+
+    Parameters
+    ----------
+
+    strategy_class : type
+        class that has Strategy as parent class
+
+    data : dict
+        symbol to its dataframe with the candles and indicators, e.g., from load_symbols. The frames are shared with
+        the workers, so the indicators are computed once per symbol and reused by every window
+
+    train, test, step : str or pd.Timedelta
+        window lengths, see walk_forward_windows
+
+    parameters : list of dict
+        parameter combinations of which the best one on the train period is tested, the default parameters of the
+        strategy are tested if None
+
+    capital : float
+        capital we can use in every window
+
+    processes : int
+        number of worker processes, all cores if None
+
+    sort_by : str
+        performance measure used to choose the parameters
+
+    vectorized : boolean
+        use the vectorized backtest engine when the strategy supports it
+
+    Returns
+    -------
+    (pd.DataFrame, pd.DataFrame)
+        the test performance per window and aggregated per symbol
+    """
+    shared = {symbol: SharedFrame(df) for symbol, df in data.items()}
+    try:
+        tasks = [(symbol, window, strategy_class, parameters, capital, sort_by, vectorized)
+                 for symbol, df in data.items()
+                 for window in walk_forward_windows(df.index, train=train, test=test, step=step)]
+        descriptors = {symbol: frame.descriptor() for symbol, frame in shared.items()}
+        processes = os.cpu_count() if processes is None else processes
+        with Pool(processes=processes, initializer=_init_worker, initargs=(descriptors,)) as pool:
+            windows = pd.DataFrame(pool.map(_run_window, tasks))
+    finally:
+        for frame in shared.values():
+            frame.close()
+
+    if len(windows) == 0:
+        return windows, pd.DataFrame()
+
+    symbols = windows.groupby("symbol").agg(windows=("test_start", "size"),
+                                            trades=("trades", "sum"),
+                                            average_return=("return", "mean"),
+                                            winning_rate=("winning rate", "mean"))
+    symbols["compounded return"] = windows.groupby("symbol")["return"].apply(lambda r: np.prod(r + 1) - 1)
+    return windows, symbols.rename(columns={"average_return": "average return", "winning_rate": "winning rate"})
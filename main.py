@@ -8,6 +8,7 @@ import cbpro
 import pandas as pd
 from datetime import datetime, timedelta
 from CoinbaseAPI import CoinbaseAPI
+from CandleStore import CandleStore
 
 pd.set_option("display.max_columns", None)
 pd.set_option("display.width", None)
@@ -19,7 +20,7 @@ with open(config_file) as json_data_file:
 client = cbpro.AuthenticatedClient(config["api_public"], config["api_secret"], config["passphrase"])
 symbol = 'BTC-EUR'
 #symbol = 'DOT-EUR'
-api = CoinbaseAPI(client=client, symbol=symbol)
+api = CoinbaseAPI(client=client, symbol=symbol, store=CandleStore())
 df = api.get_minute_data(interval_min=1, lookback=24*60)
 strat = Strategy_RSI_SMA_RETURN()
 
@@ -27,4 +28,5 @@ strat = Strategy_RSI_SMA_RETURN()
 #last_training_date = '2022-02-01'
 #strat_lstm = Strategy_LSTM(first_training_date=first_training_date, last_training_date=last_training_date, data=df)
 results = backtest(strat, df=df, symbol=symbol)
+results.render()
 print(df)
@@ -6,6 +6,10 @@ class Strategy(object):
     Base class for strategies
     """
 
+    # columns the strategy reads besides the candles, e.g., ("RSI", "EMA50", "RSI_60m"), only these indicators and
+    # the ones they depend on are computed for it; all indicators if None
+    features = None
+
     def __init__(self, stop_loss=0.95):
         self.stop_loss = stop_loss
 
@@ -15,6 +19,41 @@ class Strategy(object):
     def sell_signal(self, df, entried):
         raise NotImplementedError
 
+    def buy_signals(self, df):
+        """
+        Vectorized buy signal for every row of the data, used by the backtesting engine instead of calling
+        buy_signal once per row. Strategies that do not implement it are backtested row by row.
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame
+            DataFrame with the full history
+
+        Returns
+        -------
+        np.ndarray
+            boolean array with the buy signal of each row
+        """
+        raise NotImplementedError
+
+    def sell_signals(self, df):
+        """
+        Vectorized sell signal for every row of the data, see buy_signals. The stop-loss is not part of the signal.
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame
+            DataFrame with the full history
+
+        Returns
+        -------
+        np.ndarray
+            boolean array with the sell signal of each row
+        """
+        raise NotImplementedError
+
     def action(self, df, entried=False):
         """
         Determines the action based on the buy and sell signals
@@ -1,37 +1,39 @@
-import numpy as np
 import pandas as pd
 
+from Datasets import FeatureDataset
 from Strategy_Base import Strategy
-from Utils import obtain_period_data
 
 
 class Strategy_ML(Strategy):
 
-    def __init__(self, first_training_date, last_training_date, data: pd.DataFrame, epochs=10, lr=0.001, stop_loss=0.95):
+    def __init__(self, first_training_date, last_training_date, data: pd.DataFrame, epochs=10, lr=0.001, stop_loss=0.95,
+                 features=('Close', 'SMA50', 'SMA200', 'Volume'), lookback=1, symbol=''):
         super().__init__(stop_loss=stop_loss)
         self.first_training_date = first_training_date
         self.last_training_date = last_training_date
         self.epochs = epochs
         self.data = data
         self.lr = lr
+        self.model_features = list(features)  # the inputs of the model
+        # every column the strategy reads, subclasses add the columns of their signals
+        self.features = list(self.model_features)
+        self.symbol = symbol
+        # the label of a window is the close of the row before its last row
+        self.dataset = FeatureDataset(features=self.model_features, lookback=lookback, target='Close', horizon=-1)
 
     def data_processing(self):
-        data = self.data.copy()
-        data[['Close[-1]', 'SMA50[-1]', 'SMA200[-1]', 'Volume[-1]']] = \
-            data[['Close', 'SMA50', 'SMA200', 'Volume']].shift(-1)
-        data.shift()
-        data = data[['Close', 'Close[-1]', 'SMA50[-1]', 'SMA200[-1]', 'Volume[-1]']]
-        data.dropna(inplace=True)
-
-        train_data = data[self.first_training_date:self.last_training_date].copy()
-        X_train = train_data[['Close[-1]', 'SMA50[-1]', 'SMA200[-1]', 'Volume[-1]']]
-        Y_train = train_data['Close']
-
-        test_data = data[self.last_training_date:].copy()
-        X_test = test_data[['Close[-1]', 'SMA50[-1]', 'SMA200[-1]', 'Volume[-1]']]
-        Y_test = test_data['Close']
-
-        return np.asarray(X_train), np.asarray(Y_train), np.asarray(X_test), np.asarray(Y_test)
+        """
+        Windowed float32 train and test arrays, cached on disk by the dataset
+
+        Returns
+        -------
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+            X_train and X_test with shape (n, lookback, n_features), Y_train and Y_test with shape (n,)
+        """
+        X_train, Y_train = self.dataset.build(self.data, self.first_training_date, self.last_training_date,
+                                              symbol=self.symbol)
+        X_test, Y_test = self.dataset.build(self.data, self.last_training_date, None, symbol=self.symbol)
+        return X_train, Y_train, X_test, Y_test
 
     def fit(self):
         raise NotImplementedError
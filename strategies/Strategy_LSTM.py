@@ -1,59 +1,95 @@
 import numpy as np
 import pandas as pd
-import os
 from Utils import classify
 
-import tensorflow as tf
-from tensorflow import keras
-from keras.models import Sequential
-from keras.layers import Dense, Dropout, LSTM, BatchNormalization
-from keras.losses import MeanSquaredError
-from sklearn.model_selection import train_test_split
-
+from ModelRegistry import ModelRegistry
 from Strategy_Base_ML import Strategy_ML
 
 
 class Strategy_LSTM(Strategy_ML):
 
-    def __init__(self, first_training_date, last_training_date, data: pd.DataFrame, batch_size=100, epochs=10, lr=0.001):
+    def __init__(self, first_training_date, last_training_date, data: pd.DataFrame, batch_size=100, epochs=10, lr=0.001,
+                 predict_batch_size=65536, features=('Close', 'SMA50', 'SMA200', 'Volume'), lookback=1, symbol='',
+                 registry=None):
         super().__init__(first_training_date=first_training_date, last_training_date=last_training_date, data=data,
-                         epochs=epochs, lr=lr)
+                         epochs=epochs, lr=lr, features=features, lookback=lookback, symbol=symbol)
+        if "RSI" not in self.features:  # read by the sell signal
+            self.features.append("RSI")
         self.batch_size = batch_size
-        self.model_path = 'models/LSTM_' + str(self.first_training_date) + '__' + str(self.last_training_date)
-
-        if os.path.exists(self.model_path):
-            self.model = keras.models.load_model(self.model_path)
-        else:
-            # define the model
-            self.model = Sequential()
-            self.model.add(LSTM(128, input_shape=(1, 4), return_sequences=True))  #TODO: un-hardcode 4
-            self.model.add(Dropout(0.2))
-            #self.model.add(BatchNormalization())
-
-            self.model.add(LSTM(128, activation='relu', return_sequences=True))
-            self.model.add(Dropout(0.1))
-            #self.model.add(BatchNormalization())
-
-            self.model.add(LSTM(128, activation='relu'))
-            self.model.add(Dropout(0.1))
-            #self.model.add(BatchNormalization())
+        self.predict_batch_size = predict_batch_size
+        self.prediction_cache = {}  # (model path, first date, last date, number of rows) -> predictions
+        self.predictions = pd.Series(dtype=float)  # predictions of the last frame, looked up by buy_signal
+        self.registry = ModelRegistry() if registry is None else registry
+        self.model_spec = {"symbol": symbol, "features": self.model_features, "lookback": lookback,
+                           "first_training_date": str(first_training_date),
+                           "last_training_date": str(last_training_date)}
+
+        version = self.registry.find('LSTM', **self.model_spec)
+        if version is None:
+            version = self.fit()
+        self.model_version = version
+        self.model_path = self.registry.version_path('LSTM', version)
+
+        # load and warm up the model in the background, the first prediction waits for it if it is not done yet
+        self.model_future = self.registry.preload('LSTM', version, warm_up=self.warm_up)
+
+    @property
+    def model(self):
+        return self.model_future.result()
+
+    def warm_up(self, model):
+        """
+        Run a first prediction so the first live decision does not pay for building the graph
+        """
+        model(np.zeros((1,) + self.dataset.input_shape, dtype=np.float32), training=False)
+
+    @staticmethod
+    def build_model(input_shape):
+        """
+        Untrained LSTM model for windows of input_shape, e.g., the (lookback, number of features) of the dataset
+        """
+        from keras.models import Sequential
+        from keras.layers import Dense, Dropout, LSTM
+
+        # define the model
+        model = Sequential()
+        model.add(LSTM(128, input_shape=input_shape, return_sequences=True))
+        model.add(Dropout(0.2))
+        #model.add(BatchNormalization())
+
+        model.add(LSTM(128, activation='relu', return_sequences=True))
+        model.add(Dropout(0.1))
+        #model.add(BatchNormalization())
+
+        model.add(LSTM(128, activation='relu'))
+        model.add(Dropout(0.1))
+        #model.add(BatchNormalization())
+
+        model.add(Dense(32, activation='relu'))
+        model.add(Dropout(0.2))
+
+        model.add(Dense(1, activation='relu'))
+        return model
 
-            self.model.add(Dense(32, activation='relu'))
-            self.model.add(Dropout(0.2))
-
-            self.model.add(Dense(1, activation='relu'))
+    def fit(self):
+        """
+        Train a new model and register it as a new version
 
-            self.fit()
+        Returns
+        -------
+        int
+            the version of the model in the registry
+        """
+        from tensorflow import keras
+        from keras.losses import MeanSquaredError
 
-    def fit(self):
         X_train, Y_train, X_test, Y_test = self.data_processing()
-        X_train = X_train.reshape(-1, 1, X_train.shape[1])
         Y_train = Y_train.reshape(-1, 1, 1)
-        X_test = X_test.reshape(-1, 1, X_test.shape[1])
         Y_test = Y_test.reshape(-1, 1, 1)
 
+        model = self.build_model(self.dataset.input_shape)
         opt = keras.optimizers.Adam(learning_rate=self.lr, decay=1e-6)
-        self.model.compile(
+        model.compile(
             #loss='sparse_categorical_crossentropy',
             loss=MeanSquaredError(),
             optimizer=opt,
@@ -61,7 +97,7 @@ class Strategy_LSTM(Strategy_ML):
         )
 
         # Train model
-        self.model.fit(
+        history = model.fit(
             X_train, Y_train,
             batch_size=self.batch_size,
             epochs=self.epochs,
@@ -69,13 +105,50 @@ class Strategy_LSTM(Strategy_ML):
             verbose=1
         )
 
-        self.model.save('models/LSTM_' + str(self.first_training_date) + '__' + str(self.last_training_date))
+        metrics = {key: float(values[-1]) for key, values in history.history.items()}
+        return self.registry.register('LSTM', model, {**self.model_spec, "epochs": self.epochs, "lr": self.lr,
+                                                      "batch_size": self.batch_size, "metrics": metrics})
+
+    def predict_step(self, x):
+        """
+        Low latency prediction for a few rows, calling the model directly avoids the overhead of model.predict
+        """
+        return np.asarray(self.model(x, training=False)).reshape(-1)
+
+    def predict_frame(self, df):
+        """
+        Predictions for every row of df in batches of predict_batch_size rows, cached per model and data range.
+        After this, buy_signal looks the predictions of these rows up instead of calling the model.
+
+        Returns
+        -------
+        pd.Series
+            the predicted close per row
+        """
+        key = (self.model_path, df.index[0], df.index[-1], len(df))
+        if key not in self.prediction_cache:
+            y_pred = np.full(len(df), np.nan, dtype=np.float32)  # the first rows have no complete window
+            x = np.ascontiguousarray(self.dataset.feature_windows(df))
+            if len(x) > 0:
+                y_pred[self.dataset.lookback - 1:] = \
+                    self.model.predict(x, batch_size=self.predict_batch_size, verbose=0).reshape(-1)
+            self.prediction_cache[key] = pd.Series(y_pred, index=df.index)
+        self.predictions = self.prediction_cache[key]
+        return self.predictions
+
+    def buy_signals(self, df):
+        return (self.predict_frame(df).to_numpy() > df.Close.to_numpy())
+
+    def sell_signals(self, df):
+        return (df.RSI > 70).to_numpy()
 
     def buy_signal(self, df, entried):
-        row = df[['Close', 'SMA50', 'SMA200', 'Volume']].iloc[-1, :].copy()
-        x = np.asarray(row)
-        x = x.reshape(-1, 1, 4)
-        y_pred = self.model.predict(x)
+        row = df[self.model_features].iloc[-1, :].copy()
+        if row.name in self.predictions.index:  # already predicted in batch
+            y_pred = self.predictions[row.name]
+        else:
+            x = np.asarray(df[self.model_features].iloc[-self.dataset.lookback:, :], dtype=np.float32)
+            y_pred = self.predict_step(x.reshape((1,) + self.dataset.input_shape))[0]
         pred = classify(row.Close, y_pred)
 
         if pred == 1:
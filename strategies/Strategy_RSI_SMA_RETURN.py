@@ -1,11 +1,14 @@
-from Strategy_Base import Strategy
+from Strategy_Rules import RuleStrategy
 
 
-class Strategy_RSI_SMA_RETURN(Strategy):
+class Strategy_RSI_SMA_RETURN(RuleStrategy):
     """
     Simple strategy based on RSI, SMA and cumulative returns.
     """
 
+    buy = "EMA50 > EMA200 and RSI < RSI_buy and CUM_RETURNS_60 > returns_buy"
+    sell = "RSI > RSI_sell"
+
     def __init__(self, stop_loss=0.95, RSI_buy=40, RSI_sell=70, returns_buy=1.000):
         """
         Initialization of this simple strategy.
@@ -25,17 +28,4 @@ class Strategy_RSI_SMA_RETURN(Strategy):
         returns_buy : float
             Buy if cumulative returns > returns_buy
         """
-        super().__init__(stop_loss=stop_loss)
-        self.RSI_buy = RSI_buy
-        self.RSI_sell = RSI_sell
-        self.returns_buy = returns_buy
-
-    def buy_signal(self, df, entried):
-        row = df.iloc[-1, :]
-        return (row.EMA50 > row.EMA200) & \
-               (row.RSI < self.RSI_buy) & \
-               (row.CUM_RETURNS_60 > self.returns_buy)
-
-    def sell_signal(self, df, entried):
-        row = df.iloc[-1, :]
-        return row.RSI > self.RSI_sell
+        super().__init__(stop_loss=stop_loss, RSI_buy=RSI_buy, RSI_sell=RSI_sell, returns_buy=returns_buy)
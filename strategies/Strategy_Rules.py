@@ -0,0 +1,79 @@
+from Rules import Rule, last_values
+from Strategy_Base import Strategy
+
+
+class RuleStrategy(Strategy):
+    """
+    Strategy defined by declarative entry and exit rules, see Rules.Rule. The rules are compiled once: the backtest
+    evaluates them over the whole history with buy_signals and sell_signals and the live bot evaluates them on the
+    values of the last candle only, so both run the same definition. The stop-loss stays the ratio of the close to
+    the buying price, which the vectorized backtest engine applies itself.
+    """
+
+    buy = None  # rule of the buy signal, e.g., "EMA50 > EMA200 and RSI < RSI_buy"
+    sell = None  # rule of the sell signal, e.g., "RSI > RSI_sell"
+
+    def __init__(self, stop_loss=0.95, buy=None, sell=None, **parameters):
+        """
+        Parameters
+        ----------
+
+        stop_loss : float
+            Sell if the returns are < stop_loss [0,1]
+
+        buy : str
+            rule of the buy signal, the buy rule of the class if None
+
+        sell : str
+            rule of the sell signal, the sell rule of the class if None
+
+        parameters : dict
+            values of the parameters of the rules, e.g., RSI_buy=40, they are also set as attributes
+        """
+        super().__init__(stop_loss=stop_loss)
+        for name, value in parameters.items():
+            setattr(self, name, value)
+        self.buy_rule = Rule(self.buy if buy is None else buy, parameters)
+        self.sell_rule = Rule(self.sell if sell is None else sell, parameters)
+        # only the indicators of the rules are computed for the strategy
+        self.features = tuple(dict.fromkeys(self.buy_rule.columns + self.sell_rule.columns))
+        self.sell_columns = list(dict.fromkeys(self.sell_rule.columns + ["Close", "last_buying_price"]))
+
+    def buy_signal(self, df, entried):
+        return self.buy_rule.last(df)
+
+    def sell_signal(self, df, entried):
+        return self.sell_rule.last(df)
+
+    def buy_signals(self, df):
+        return self.buy_rule.signals(df)
+
+    def sell_signals(self, df):
+        return self.sell_rule.signals(df)
+
+    def action(self, df, entried=False):
+        """
+        Same decision as Strategy.action, only the rule of the position is evaluated on the values of the columns it
+        reads in the last row
+
+        Parameters
+        ----------
+
+        df : pd.DataFrame or CandleFrame
+            the latest data, with a last_buying_price column when entried
+
+        entried : boolean
+            Whether we are already entried
+
+        Returns
+        -------
+        str
+            A string with the action: "BUY", "SELL" or "NO TRADE"
+        """
+        if not entried:
+            return "BUY" if self.buy_rule.last(df) else "NO TRADE"
+
+        values = last_values(df, self.sell_columns)
+        if self.sell_rule.evaluate(values) or values["Close"] / values["last_buying_price"] < self.stop_loss:
+            return "SELL"
+        return "NO TRADE"